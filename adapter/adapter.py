@@ -137,3 +137,178 @@ socket = UKSocket()
 adapter = Adapter(socket)
 kettle = ElectricKettle(adapter)
 kettle.boil()
+
+
+# Рукописный адаптер на каждый вызов добавляет лишний кадр Python и поиск 
+# атрибутов: adapter.live() -> self._socket.live(). Если адаптер лишь 
+# переименовывает методы, его можно собрать по описанию: при создании 
+# экземпляра в него кладутся уже связанные методы адаптируемого объекта, и 
+# вызов через адаптер становится вызовом самого адаптируемого метода.
+# Константы (вроде напряжения 110 В) отдаются C-функцией itertools.repeat, 
+# поэтому и они не создают кадра Python.
+
+import itertools
+import timeit
+
+
+class Constant:
+    """Значение, которое метод адаптера возвращает всегда"""
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+
+def build_adapter(target: type, mapping: dict, name: str = None) -> type:
+    """Создаёт класс адаптера к интерфейсу target.
+
+    mapping связывает имя метода target с именем метода адаптируемого 
+    объекта или с Constant.
+    """
+    def make_placeholder(method_name):
+        # Методы объявляются и в классе, иначе ABC не даст создать экземпляр 
+        # с нереализованными абстрактными методами. Вызываются они, только 
+        # если экземпляр создан в обход __init__.
+        def placeholder(self, *args, **kwargs):
+            raise TypeError(f'{type(self).__name__}.{method_name} is not '
+                            f'bound to an adaptee')
+        placeholder.__name__ = method_name
+        return placeholder
+
+    def __init__(self, adaptee) -> None:
+        self._adaptee = adaptee
+        for method_name, source in mapping.items():
+            if isinstance(source, Constant):
+                forward = itertools.repeat(source.value).__next__
+            else:
+                forward = getattr(adaptee, source)
+            setattr(self, method_name, forward)
+
+    namespace = {method_name: make_placeholder(method_name) 
+                 for method_name in mapping}
+    namespace['__init__'] = __init__
+    return type(name or f'{target.__name__}Adapter', (target,), namespace)
+
+
+GeneratedTargetAdapter = build_adapter(ITarget, 
+                                       {'do_smth': 'do_smth_good'})
+Client(GeneratedTargetAdapter(Adaptee())).do_smth_for_client()
+
+GeneratedSocketAdapter = build_adapter(USASocketInterface, {
+    'voltage': Constant(110),
+    'live': 'live',
+    'neutral': 'neutral',
+})
+ElectricKettle(GeneratedSocketAdapter(UKSocket())).boil()
+
+# Сравним стоимость одного вызова
+
+calls = 1_000_000
+socket = UKSocket()
+for title, obj in (('direct', socket), 
+                   ('handwritten', Adapter(socket)), 
+                   ('generated', GeneratedSocketAdapter(socket))):
+    live_time = timeit.timeit(obj.live, number=calls)
+    voltage_time = timeit.timeit(obj.voltage, number=calls)
+    print(f'{title}: live {live_time / calls * 1e9:.0f} ns, '
+          f'voltage {voltage_time / calls * 1e9:.0f} ns')
+
+
+# Когда розеток тысячи, опрашивать каждую через адаптер и кипятить каждый 
+# чайник по отдельности слишком медленно. Адаптер может работать и с целым 
+# парком сразу: показания хранятся колонками в array, а адаптер отдаёт 
+# колонки американского интерфейса. То, что адаптеру менять не нужно (live и 
+# neutral), отдаётся без копирования.
+
+import contextlib
+import io
+import random
+import time
+from array import array
+
+
+class UKSocketReadings:
+    """Показания парка английских розеток, по колонке на метод 
+    UKSocketInterface"""
+
+    def __init__(self, voltage, live, neutral, earth) -> None:
+        self.voltage = array('d', voltage)
+        self.live = array('b', live)
+        self.neutral = array('b', neutral)
+        self.earth = array('b', earth)
+
+    @classmethod
+    def from_sockets(cls, sockets: list):
+        return cls([socket.voltage() for socket in sockets], 
+                   [socket.live() for socket in sockets], 
+                   [socket.neutral() for socket in sockets], 
+                   [socket.earth() for socket in sockets])
+
+    def __len__(self):
+        return len(self.voltage)
+
+
+class BulkSocketAdapter:
+    """Adapter для парка: те же методы, что у USASocketInterface, но каждый 
+    возвращает колонку значений"""
+
+    def __init__(self, readings: UKSocketReadings) -> None:
+        self._readings = readings
+
+    def voltage(self) -> array:
+        return array('d', [110]) * len(self._readings)
+
+    def live(self) -> array:
+        return self._readings.live
+
+    def neutral(self) -> array:
+        return self._readings.neutral
+
+
+# Результаты кипячения кодируются числами, сообщения - те же, что печатает 
+# ElectricKettle.boil
+BURN, NO_POWER, DONE = range(3)
+BOIL_MESSAGES = ('Burn the kitchen', 'No power', 'Done!')
+
+
+def boil_fleet(power) -> array:
+    """Проверка ElectricKettle.boil сразу для всего парка"""
+    return array('B', [
+        BURN if voltage > 110 
+        else NO_POWER if live == 1 and neutral == -1 
+        else DONE
+        for voltage, live, neutral 
+        in zip(power.voltage(), power.live(), power.neutral())
+    ])
+
+
+class FaultySocket(UKSocket):
+
+    def live(self):
+        return 0
+
+
+fleet = [random.choice((UKSocket, FaultySocket))() for _ in range(100_000)]
+
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()) as output:
+    for socket in fleet:
+        ElectricKettle(Adapter(socket)).boil()
+object_elapsed = time.perf_counter() - start
+
+# Сборка колонок из объектов - это те же четыре вызова на розетку, от 
+# которых пакетный путь и избавляет, поэтому замеряем её отдельно. Основной 
+# выигрыш получается, когда показания сразу приходят колонками (например, 
+# из телеметрии), а не собираются из объектов.
+start = time.perf_counter()
+readings = UKSocketReadings.from_sockets(fleet)
+converted = time.perf_counter()
+statuses = boil_fleet(BulkSocketAdapter(readings))
+bulk_elapsed = time.perf_counter() - converted
+convert_elapsed = converted - start
+
+assert output.getvalue().splitlines() == [BOIL_MESSAGES[status] 
+                                          for status in statuses]
+print(f'per object: {object_elapsed:.3f}s, '
+      f'bulk from objects: {convert_elapsed + bulk_elapsed:.3f}s '
+      f'(conversion {convert_elapsed:.3f}s), '
+      f'bulk from columns: {bulk_elapsed:.3f}s')
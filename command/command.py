@@ -68,7 +68,7 @@ class ButtonPanel:
 
     def __init__(self) -> None:
         # Сначала заполним действиями-пустышками с подходящим интерфейсом
-        self.buttons = [NoCommand] * self.button_quantity
+        self.buttons = [NoCommand()] * self.button_quantity
 
     def handle_btn_pressed(self, idx):
         self.buttons[idx].execute()
@@ -92,3 +92,827 @@ btn_panel.handle_btn_pressed(1)
 # Панелей с кнопками может быть несколько, команды на проигрывание могут идти 
 # из разных источников, но приходить они будут через единый интерфейс и о 
 # подробностях реализации ничего знать не будут
+
+
+# Инициатор выполняет команду прямо в handle_btn_pressed, поэтому один 
+# медленный исполнитель задерживает нажатия всех кнопок. Раз запрос 
+# инкапсулирован в объект-команду, его можно положить в очередь и выполнить 
+# позже в другом потоке - инициатору это ничего не стоит.
+# Очередь ограничена: когда исполнители не успевают, нажатие ждёт свободного 
+# места (или сразу получает queue.Full), а не копит команды без предела.
+# Если важен порядок - например, команды одного плеера должны выполняться 
+# друг за другом - нажатие можно пометить ключом: команды с одним ключом 
+# всегда попадают к одному и тому же исполнителю, а команды без ключа 
+# раздаются исполнителям по кругу.
+
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+_STOP = object()
+
+
+class QueuedButtonPanel(ButtonPanel):
+    """Инициатор с пулом потоков-исполнителей"""
+
+    def __init__(self, workers: int = 4, maxsize: int = 1024, 
+                 ordered: bool = False) -> None:
+        super().__init__()
+        # Без упорядочивания все потоки разбирают общую очередь, так нагрузка 
+        # распределяется равномерно
+        queues_count = workers if ordered else 1
+        self._queues = [queue.Queue(maxsize) for _ in range(queues_count)]
+        self._next_queue = itertools.count()
+        self.wait_times = deque(maxlen=100_000)
+        self.executed = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, 
+                             args=(self._queues[idx % queues_count],), 
+                             daemon=True)
+            for idx in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def handle_btn_pressed(self, idx, key=None, block=True, timeout=None):
+        """Ставит команду кнопки в очередь.
+
+        Если очередь заполнена, ждёт до timeout секунд, а при block=False 
+        или по истечении времени бросает queue.Full.
+        """
+        if key is None:
+            command_queue = self._queues[
+                next(self._next_queue) % len(self._queues)]
+        else:
+            command_queue = self._queues[hash(key) % len(self._queues)]
+        command_queue.put((self.buttons[idx], time.perf_counter()), 
+                          block, timeout)
+
+    def _work(self, command_queue):
+        while True:
+            item = command_queue.get()
+            if item is _STOP:
+                return
+
+            command, queued_at = item
+            wait_time = time.perf_counter() - queued_at
+            try:
+                command.execute()
+                failed = False
+            except Exception:
+                failed = True
+            with self._stats_lock:
+                self.wait_times.append(wait_time)
+                self.executed += 1
+                self.errors += failed
+
+    def close(self):
+        """Дожидается выполнения поставленных команд и останавливает 
+        исполнителей"""
+        for idx in range(len(self._workers)):
+            self._queues[idx % len(self._queues)].put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+
+class AsyncioButtonPanel(ButtonPanel):
+    """То же для asyncio: очередь разбирают задачи, а сами команды 
+    синхронные и выполняются в потоках, чтобы не блокировать цикл событий"""
+
+    def __init__(self, workers: int = 4, maxsize: int = 1024, 
+                 ordered: bool = False) -> None:
+        super().__init__()
+        queues_count = workers if ordered else 1
+        self._queues = [asyncio.Queue(maxsize) for _ in range(queues_count)]
+        self._next_queue = itertools.count()
+        self.wait_times = deque(maxlen=100_000)
+        self.executed = 0
+        self.errors = 0
+        self._tasks = [
+            asyncio.create_task(self._work(self._queues[idx % queues_count]))
+            for idx in range(workers)
+        ]
+
+    async def handle_btn_pressed(self, idx, key=None):
+        if key is None:
+            command_queue = self._queues[
+                next(self._next_queue) % len(self._queues)]
+        else:
+            command_queue = self._queues[hash(key) % len(self._queues)]
+        # Ждём свободного места - это и есть противодавление
+        await command_queue.put((self.buttons[idx], time.perf_counter()))
+
+    async def _work(self, command_queue):
+        while True:
+            item = await command_queue.get()
+            if item is _STOP:
+                return
+
+            command, queued_at = item
+            self.wait_times.append(time.perf_counter() - queued_at)
+            try:
+                await asyncio.to_thread(command.execute)
+            except Exception:
+                self.errors += 1
+            self.executed += 1
+
+    async def close(self):
+        for idx in range(len(self._tasks)):
+            await self._queues[idx % len(self._queues)].put(_STOP)
+        await asyncio.gather(*self._tasks)
+
+
+# Замерим пропускную способность и время ожидания в очереди при разной 
+# нагрузке. Исполнитель тратит на команду 1 мс, 8 исполнителей справляются 
+# примерно с 8000 команд в секунду.
+
+class SlowReceiver:
+
+    def play(self):
+        time.sleep(0.001)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+for offered_rate in (1000, 4000, 16000):
+    panel = QueuedButtonPanel(workers=8, maxsize=256)
+    panel.set_command(0, PlayMusicCommand(SlowReceiver()))
+    start = time.perf_counter()
+    pressed = 0
+    # Нажимаем пачками каждые 10 мс в течение полсекунды
+    while time.perf_counter() - start < 0.5:
+        for _ in range(offered_rate // 100):
+            panel.handle_btn_pressed(0)
+            pressed += 1
+        time.sleep(0.01)
+    panel.close()
+    elapsed = time.perf_counter() - start
+    print(f'offered {offered_rate}/s: done {panel.executed / elapsed:.0f}/s, '
+          f'queue wait p50 {percentile(panel.wait_times, 50) * 1000:.1f} ms, '
+          f'p99 {percentile(panel.wait_times, 99) * 1000:.1f} ms')
+
+
+async def main():
+    panel = AsyncioButtonPanel(workers=8, maxsize=256, ordered=True)
+    panel.set_command(0, PlayMusicCommand(SlowReceiver()))
+    start = time.perf_counter()
+    for idx in range(2000):
+        await panel.handle_btn_pressed(0, key=idx % 16)
+    await panel.close()
+    print(f'asyncio: {panel.executed / (time.perf_counter() - start):.0f}/s')
+
+
+asyncio.run(main())
+
+
+# Команды можно объединять. Макрокоманда - тоже команда, она выполняет 
+# список других команд как одно целое, поэтому инициатор её ничем не 
+# отличает от обычной.
+
+class MacroCommand(ICommand):
+
+    def __init__(self, commands: list) -> None:
+        self._commands = list(commands)
+
+    def __iter__(self):
+        return iter(self._commands)
+
+    def execute(self):
+        for command in self._commands:
+            command.execute()
+
+
+def iter_commands(command: ICommand):
+    """Отдаёт простые команды, из которых состоит команда, раскрывая 
+    вложенные макрокоманды на любую глубину"""
+    if isinstance(command, MacroCommand):
+        for sub_command in command:
+            yield from iter_commands(sub_command)
+    else:
+        yield command
+
+
+# При всплесках ввода инициатор получает много лишних команд: например, 
+# play десять раз подряд. Если команда идемпотентна (повтор ничего не 
+# меняет), её повтор в пределах окна можно просто отбросить - но только если 
+# между повторами ничего другого не выполнялось: после "pause" очередной 
+# "play" уже не лишний.
+
+class CoalescingButtonPanel(ButtonPanel):
+
+    def __init__(self, window: float = 0.2) -> None:
+        super().__init__()
+        self._window = window
+        self._last_command = None
+        self._last_executed = float('-inf')
+        self.coalesced = 0
+
+    def handle_btn_pressed(self, idx):
+        command = self.buttons[idx]
+        now = time.monotonic()
+        if (command is self._last_command 
+                and getattr(command, 'idempotent', False)
+                and now - self._last_executed < self._window):
+            self.coalesced += 1
+            return
+
+        self._last_command = command
+        self._last_executed = now
+        self._execute(command)
+
+    def _execute(self, command):
+        command.execute()
+
+
+# Для отмены и повтора нужно помнить выполненные команды. Хранить сами 
+# объекты дорого: каждый тянет за собой исполнителя и весь граф его 
+# объектов. Вместо этого журнал хранит только номер типа команды и два 
+# числа - новое и прежнее значение - в кольцевом буфере на array, а объект 
+# команды заново собирается фабрикой, когда его нужно отменить или повторить.
+# Так можно журналировать команды вида "установить значение": отмена - это 
+# установка прежнего значения. Такая команда сообщает журналу, что она 
+# установит и что было до неё.
+
+from array import array
+
+
+class ISetterCommand(ICommand):
+
+    idempotent = True
+
+    @abstractmethod
+    def journal_values(self) -> tuple:
+        """Возвращает пару (новое значение, текущее значение)"""
+
+
+class CommandJournal:
+    """Журнал отмены и повтора на кольцевом буфере.
+
+    Записи, выполненные одной макрокомандой, помечены как группа и 
+    отменяются вместе. Когда буфер заполнен, самые старые записи 
+    перезаписываются.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._capacity = capacity
+        self._type_ids = array('H', bytes(2 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._prev_values = array('d', bytes(8 * capacity))
+        # 1 - запись начинает группу, 0 - продолжает предыдущую
+        self._group_starts = array('B', bytes(capacity))
+        self._factories = []
+        self._type_ids_by_class = {}
+        self._start = 0
+        self._undoable = 0
+        self._redoable = 0
+
+    def register(self, command_class, factory) -> int:
+        """factory(value) собирает команду, устанавливающую value"""
+        type_id = len(self._factories)
+        self._factories.append(factory)
+        self._type_ids_by_class[command_class] = type_id
+        return type_id
+
+    def is_journaled(self, command) -> bool:
+        return type(command) in self._type_ids_by_class
+
+    def record(self, command: ISetterCommand, values: tuple, 
+               group_start: bool = True) -> None:
+        # Новая запись отменяет возможность повтора
+        self._redoable = 0
+        if self._undoable == self._capacity:
+            self._start = (self._start + 1) % self._capacity
+            self._undoable -= 1
+            # Не оставляем в начале буфера оборванный хвост группы
+            while self._undoable and not self._group_starts[self._start]:
+                self._start = (self._start + 1) % self._capacity
+                self._undoable -= 1
+
+        pos = (self._start + self._undoable) % self._capacity
+        self._type_ids[pos] = self._type_ids_by_class[type(command)]
+        self._values[pos], self._prev_values[pos] = values
+        self._group_starts[pos] = group_start
+        self._undoable += 1
+
+    def undo(self) -> bool:
+        if not self._undoable:
+            return False
+
+        while self._undoable:
+            self._undoable -= 1
+            self._redoable += 1
+            pos = (self._start + self._undoable) % self._capacity
+            factory = self._factories[self._type_ids[pos]]
+            factory(self._prev_values[pos]).execute()
+            if self._group_starts[pos]:
+                break
+
+        return True
+
+    def redo(self) -> bool:
+        if not self._redoable:
+            return False
+
+        first = True
+        while self._redoable:
+            pos = (self._start + self._undoable) % self._capacity
+            if self._group_starts[pos] and not first:
+                break
+            first = False
+            factory = self._factories[self._type_ids[pos]]
+            factory(self._values[pos]).execute()
+            self._undoable += 1
+            self._redoable -= 1
+
+        return True
+
+
+class JournaledButtonPanel(CoalescingButtonPanel):
+
+    def __init__(self, journal: CommandJournal, window: float = 0.2) -> None:
+        super().__init__(window)
+        self.journal = journal
+
+    def _execute(self, command):
+        # Вся макрокоманда, включая вложенные, отменяется одной группой
+        group_start = True
+        for sub_command in iter_commands(command):
+            if self.journal.is_journaled(sub_command):
+                values = sub_command.journal_values()
+                sub_command.execute()
+                self.journal.record(sub_command, values, group_start)
+                group_start = False
+            else:
+                sub_command.execute()
+
+    def undo(self) -> bool:
+        # Отмена меняет состояние, повтор последней команды уже не лишний
+        self._last_command = None
+        return self.journal.undo()
+
+    def redo(self) -> bool:
+        self._last_command = None
+        return self.journal.redo()
+
+
+class Stereo:
+    """Receiver/исполнитель"""
+
+    def __init__(self) -> None:
+        self.volume = 0.0
+        self.playing = 0.0
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def set_playing(self, playing):
+        self.playing = playing
+
+
+class SetVolumeCommand(ISetterCommand):
+
+    def __init__(self, stereo: Stereo, volume: float) -> None:
+        self._stereo = stereo
+        self._volume = volume
+
+    def journal_values(self) -> tuple:
+        return self._volume, self._stereo.volume
+
+    def execute(self):
+        self._stereo.set_volume(self._volume)
+
+
+class SetPlayingCommand(ISetterCommand):
+
+    def __init__(self, stereo: Stereo, playing: float) -> None:
+        self._stereo = stereo
+        self._playing = playing
+
+    def journal_values(self) -> tuple:
+        return self._playing, self._stereo.playing
+
+    def execute(self):
+        self._stereo.set_playing(self._playing)
+
+
+stereo = Stereo()
+journal = CommandJournal(capacity=64)
+journal.register(SetVolumeCommand, 
+                 lambda volume: SetVolumeCommand(stereo, volume))
+journal.register(SetPlayingCommand, 
+                 lambda playing: SetPlayingCommand(stereo, playing))
+
+panel = JournaledButtonPanel(journal)
+panel.set_command(0, SetPlayingCommand(stereo, 1))
+panel.set_command(1, MacroCommand([SetPlayingCommand(stereo, 1), 
+                                   SetVolumeCommand(stereo, 11)]))
+panel.set_command(2, SetVolumeCommand(stereo, 5))
+
+# Десять нажатий play подряд выполняются один раз
+for _ in range(10):
+    panel.handle_btn_pressed(0)
+panel.handle_btn_pressed(2)
+panel.handle_btn_pressed(1)
+print(f'coalesced: {panel.coalesced}, volume: {stereo.volume}')
+panel.undo()  # отменяет макрокоманду целиком
+print(f'after undo: volume {stereo.volume}, playing {stereo.playing}')
+panel.undo()
+panel.undo()
+print(f'after undo x3: volume {stereo.volume}, playing {stereo.playing}')
+panel.redo()
+print(f'after redo: volume {stereo.volume}, playing {stereo.playing}')
+
+
+# Раз команда - это объект-запрос, её можно записать на диск до выполнения и 
+# после сбоя выполнить журнал заново. Каждая команда сериализуется в 
+# бинарную запись фиксированного размера: номер типа, значение и контрольная 
+# сумма, по которой при чтении отсекается недописанный хвост. Макрокоманда 
+# записывается как её команды подряд, NoCommand не записывается вовсе.
+# Самое дорогое - fsync, поэтому записи копятся в буфере, а отдельный поток 
+# сбрасывает их на диск одним fsync на всю группу (group commit). Поток не 
+# ждёт по таймеру: следующий сброс начинается сразу после предыдущего, а 
+# пока идёт fsync, в буфере накапливается следующая группа. Вызывающий 
+# ждёт, пока его запись станет надёжной, но ожидающие делят один fsync на 
+# всех. При interval > 0 поток дополнительно держит окно, пока не наберётся 
+# batch_size записей, - это имеет смысл, только если нажимающих больше, чем 
+# batch_size.
+# Если запись на диск не удалась, журнал больше не принимает команд: 
+# ошибка достаётся всем, кто ждёт, и каждому следующему append.
+
+import mmap
+import os
+import struct
+import zlib
+
+
+class CommandLog:
+
+    _record = struct.Struct('<HdI')
+    _payload = struct.Struct('<Hd')
+
+    def __init__(self, path: str, interval: float = 0.0, 
+                 batch_size: int = 64) -> None:
+        self._path = path
+        self._interval = interval
+        self._batch_bytes = batch_size * self._record.size
+        self._factories = []
+        self._type_ids_by_class = {}
+        self._file = open(path, 'ab')
+        self._buffer = bytearray()
+        self._appended = 0
+        self._durable = 0
+        self._closed = False
+        self._error = None
+        lock = threading.Lock()
+        self._has_data = threading.Condition(lock)
+        self._flushed = threading.Condition(lock)
+        self._flusher = threading.Thread(target=self._flush_loop, 
+                                         daemon=True)
+        self._flusher.start()
+
+    def register(self, command_class, factory) -> int:
+        """factory(value) собирает команду при чтении журнала"""
+        type_id = len(self._factories)
+        self._factories.append(factory)
+        self._type_ids_by_class[command_class] = type_id
+        return type_id
+
+    def check(self, command: ICommand) -> None:
+        """Бросает TypeError, если команду нельзя записать в журнал"""
+        self._pack(command)
+
+    def _pack(self, command: ICommand) -> bytes:
+        return b''.join(map(self._pack_one, iter_commands(command)))
+
+    def _pack_one(self, command: ICommand) -> bytes:
+        if isinstance(command, NoCommand):
+            return b''
+
+        type_id = self._type_ids_by_class.get(type(command))
+        if type_id is None:
+            raise TypeError(f'{type(command).__name__} is not registered '
+                            f'in the command log')
+        if isinstance(command, ISetterCommand):
+            value = command.journal_values()[0]
+        else:
+            value = 0.0
+        payload = self._payload.pack(type_id, value)
+        return payload + zlib.crc32(payload).to_bytes(4, 'little')
+
+    def append(self, command: ICommand, wait: bool = True) -> None:
+        """Добавляет команду в журнал. При wait=True возвращается только 
+        после того, как запись попала на диск."""
+        data = self._pack(command)
+        if not data:
+            return
+
+        with self._has_data:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise ValueError('Command log is closed')
+            was_empty = not self._buffer
+            self._buffer += data
+            # Поток сброса ждёт либо первой записи, либо заполнения окна
+            if was_empty or len(self._buffer) >= self._batch_bytes:
+                self._has_data.notify()
+            self._appended += 1
+            seq = self._appended
+            if wait:
+                while self._durable < seq:
+                    if self._error is not None:
+                        raise self._error
+                    self._flushed.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self._has_data:
+                while not self._buffer and not self._closed:
+                    self._has_data.wait()
+                if self._interval:
+                    deadline = time.monotonic() + self._interval
+                    while (len(self._buffer) < self._batch_bytes 
+                           and not self._closed):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._has_data.wait(remaining)
+                data, self._buffer = self._buffer, bytearray()
+                seq = self._appended
+                closed = self._closed
+
+            try:
+                if data:
+                    self._file.write(data)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            except Exception as exc:
+                with self._flushed:
+                    self._error = exc
+                    self._flushed.notify_all()
+                return
+
+            with self._flushed:
+                self._durable = seq
+                self._flushed.notify_all()
+
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._has_data:
+            self._closed = True
+            self._has_data.notify()
+        self._flusher.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def replay(self):
+        """Читает журнал через mmap и отдаёт восстановленные команды.
+
+        Чтение останавливается на первой повреждённой записи, а сам 
+        повреждённый хвост отрезается, чтобы новые записи шли сразу за 
+        последней целой.
+        """
+        valid_size = 0
+        with open(self._path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if not size:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                view = memoryview(data)[:size - size % self._record.size]
+                try:
+                    for type_id, value, crc in self._record.iter_unpack(view):
+                        payload = self._payload.pack(type_id, value)
+                        if zlib.crc32(payload) != crc:
+                            break
+                        valid_size += self._record.size
+                        yield self._factories[type_id](value)
+                finally:
+                    view.release()
+
+        if valid_size < size:
+            os.truncate(self._path, valid_size)
+
+
+class LoggedButtonPanel(ButtonPanel):
+    """Инициатор, записывающий команду в журнал перед выполнением.
+
+    Команду, которую журнал не умеет записать, нельзя назначить на кнопку - 
+    ошибка возникает в set_command, а не при нажатии.
+    """
+
+    def __init__(self, log: CommandLog) -> None:
+        super().__init__()
+        self._log = log
+
+    def set_command(self, idx, command: ICommand):
+        self._log.check(command)
+        super().set_command(idx, command)
+
+    def handle_btn_pressed(self, idx):
+        command = self.buttons[idx]
+        self._log.append(command)
+        command.execute()
+
+
+# Замерим, сколько команд в секунду переживают сбой, когда нажимают 16 
+# потоков одновременно. Для сравнения - fsync на каждую команду. Окно в 
+# 5 мс с batch_size=16 закрывается, как только все 16 потоков встали в 
+# очередь, а с batch_size по умолчанию (64) ждёт все 5 мс.
+
+import tempfile
+
+
+class FsyncEachLog(CommandLog):
+
+    def append(self, command: ICommand, wait: bool = True) -> None:
+        data = self._pack(command)
+        if not data:
+            return
+
+        with self._has_data:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+
+log_configs = {
+    'fsync per command': (FsyncEachLog, {}),
+    'group commit': (CommandLog, {}),
+    'group commit, 5 ms window, batch 16': 
+        (CommandLog, {'interval': 0.005, 'batch_size': 16}),
+    'group commit, 5 ms window, batch 64': 
+        (CommandLog, {'interval': 0.005}),
+}
+
+with tempfile.TemporaryDirectory() as log_dir:
+    for log_idx, (title, (log_class, options)) in enumerate(
+            log_configs.items()):
+        stereo = Stereo()
+        log = log_class(os.path.join(log_dir, f'{log_idx}.log'), **options)
+        log.register(SetVolumeCommand, 
+                     lambda volume: SetVolumeCommand(stereo, volume))
+        panel = LoggedButtonPanel(log)
+        panel.set_command(0, SetVolumeCommand(stereo, 7))
+
+        def press_many():
+            for _ in range(200):
+                panel.handle_btn_pressed(0)
+                # Пустая кнопка ничего не пишет в журнал
+                panel.handle_btn_pressed(1)
+
+        presser_threads = [threading.Thread(target=press_many) 
+                           for _ in range(16)]
+        start = time.perf_counter()
+        for thread in presser_threads:
+            thread.start()
+        for thread in presser_threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        log.close()
+        print(f'{title}: {16 * 200 / elapsed:.0f} commands/s')
+
+    # После "сбоя" восстанавливаем состояние из журнала
+    restored = Stereo()
+    log = CommandLog(os.path.join(log_dir, '1.log'))
+    log.register(SetVolumeCommand, 
+                 lambda volume: SetVolumeCommand(restored, volume))
+    replayed = 0
+    for command in log.replay():
+        command.execute()
+        replayed += 1
+    log.close()
+    print(f'replayed {replayed} commands, volume {restored.volume}')
+
+    # Незарегистрированная команда отвергается ещё при назначении на кнопку
+    empty_log = CommandLog(os.path.join(log_dir, 'empty.log'))
+    try:
+        LoggedButtonPanel(empty_log).set_command(
+            0, PlayMusicCommand(MusicPlayer()))
+    except TypeError as exc:
+        print(f'set_command: {exc}')
+    empty_log.close()
+
+
+# Инициатор - единственное место, через которое проходят все команды, 
+# поэтому именно здесь удобно измерять, какие из них занимают больше всего 
+# времени. Счётчики вызовов и исключений ведутся всегда, а время замеряется 
+# у каждого sample_every-го вызова каждого класса команд - так накладные 
+# расходы на горячем пути остаются небольшими. Общее время для выборочных 
+# замеров оценивается экстраполяцией.
+# Профилировщик рассчитан на один поток диспетчеризации.
+
+class CommandStats:
+
+    def __init__(self, keep: int) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.sampled = 0
+        self.sampled_time = 0.0
+        self.latencies = deque(maxlen=keep)
+
+
+class CommandProfiler:
+
+    def __init__(self, sample_every: int = 1, keep: int = 10_000) -> None:
+        self._sample_every = sample_every
+        self._keep = keep
+        self._stats = {}
+
+    def dispatch(self, command: ICommand):
+        stats = self._stats.get(type(command))
+        if stats is None:
+            stats = self._stats[type(command)] = CommandStats(self._keep)
+
+        stats.calls += 1
+        if stats.calls % self._sample_every:
+            try:
+                return command.execute()
+            except Exception:
+                stats.errors += 1
+                raise
+
+        start = time.perf_counter()
+        try:
+            return command.execute()
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.sampled += 1
+            stats.sampled_time += elapsed
+            stats.latencies.append(elapsed)
+
+    def as_dict(self) -> dict:
+        result = {}
+        for command_class, stats in self._stats.items():
+            if stats.sampled:
+                mean = stats.sampled_time / stats.sampled
+                p50, p95, p99 = (percentile(stats.latencies, percent) 
+                                 for percent in (50, 95, 99))
+            else:
+                mean = p50 = p95 = p99 = 0.0
+            result[command_class.__qualname__] = {
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'sampled': stats.sampled,
+                'total_time': mean * stats.calls,
+                'mean': mean,
+                'p50': p50,
+                'p95': p95,
+                'p99': p99,
+            }
+
+        return result
+
+    def report(self) -> str:
+        stats = sorted(self.as_dict().items(), 
+                       key=lambda item: item[1]['total_time'], reverse=True)
+        lines = [f'{"command":<20}{"calls":>8}{"errors":>8}{"total, s":>10}'
+                 f'{"p50, ms":>10}{"p95, ms":>10}{"p99, ms":>10}']
+        for name, row in stats:
+            lines.append(
+                f'{name:<20}{row["calls"]:>8}{row["errors"]:>8}'
+                f'{row["total_time"]:>10.3f}{row["p50"] * 1000:>10.3f}'
+                f'{row["p95"] * 1000:>10.3f}{row["p99"] * 1000:>10.3f}')
+
+        return '\n'.join(lines)
+
+
+class ProfiledButtonPanel(ButtonPanel):
+
+    def __init__(self, profiler: CommandProfiler) -> None:
+        super().__init__()
+        self.profiler = profiler
+
+    def handle_btn_pressed(self, idx):
+        self.profiler.dispatch(self.buttons[idx])
+
+
+class FailingCommand(ICommand):
+
+    def execute(self):
+        raise RuntimeError('receiver is offline')
+
+
+panel = ProfiledButtonPanel(CommandProfiler(sample_every=10))
+panel.set_command(0, PlayMusicCommand(SlowReceiver()))
+panel.set_command(1, SetVolumeCommand(Stereo(), 3))
+panel.set_command(2, FailingCommand())
+for press in range(600):
+    try:
+        panel.handle_btn_pressed(press % 3)
+    except RuntimeError:
+        pass
+print(panel.profiler.report())
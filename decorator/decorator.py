@@ -51,3 +51,159 @@ beverage = Whip(beverage)
 
 print('Order: ' + beverage.get_description())
 print(f'Cost: {beverage.cost()}$')
+
+
+# У длинных цепочек декораторов есть цена: каждый вызов cost() и 
+# get_description() проходит всю цепочку вниз - это глубина вызовов Python, 
+# а на нескольких тысячах обёрток упирается в лимит рекурсии. Описание к тому 
+# же собирается сложением строк на каждом уровне, что даёт O(n^2).
+# Декоратор может считать результат один раз в момент обёртывания: стоимость 
+# обёрнутого напитка уже известна, остаётся прибавить свою. Описание 
+# собирается одним join при первом запросе: обход вниз по цепочке 
+# останавливается на первой обёртке, у которой описание уже собрано, и 
+# переиспользует его.
+
+import sys
+import time
+
+
+class FlatCondimentDecorator(CondimentDecorator):
+
+    _name: str = ''
+    _price: float = 0.0
+
+    def __init__(self, beverage: Beverage):
+        super().__init__(beverage)
+        # Складываем в том же порядке, что и рекурсивная версия, чтобы 
+        # результат совпадал до последнего бита
+        self._cost = beverage.cost() + self._price
+        self._cached_description = None
+
+    def cost(self) -> float:
+        return self._cost
+
+    def get_description(self) -> str:
+        if self._cached_description is None:
+            names = []
+            node = self
+            while (isinstance(node, FlatCondimentDecorator) 
+                   and node._cached_description is None):
+                names.append(node._name)
+                node = node._beverage
+            names.append(node.get_description())
+            names.reverse()
+            self._cached_description = ', '.join(names)
+
+        return self._cached_description
+
+
+class FlatWhip(FlatCondimentDecorator):
+
+    _name: str = 'Whip'
+    _price: float = 0.2
+
+
+# Сравним на цепочках разной глубины
+
+def measure(condiment, depth):
+    beverage = Latte()
+    start = time.perf_counter()
+    for _ in range(depth):
+        beverage = condiment(beverage)
+    wrapped = time.perf_counter()
+    try:
+        for _ in range(10):
+            beverage.cost()
+            beverage.get_description()
+    except RecursionError:
+        return f'wrap {wrapped - start:.4f}s, RecursionError'
+
+    return (f'wrap {wrapped - start:.4f}s, '
+            f'10 x cost+description {time.perf_counter() - wrapped:.4f}s')
+
+
+print(f'recursion limit: {sys.getrecursionlimit()}')
+for depth in (10, 1000, 100_000):
+    print(f'depth {depth}: Whip - {measure(Whip, depth)}')
+    print(f'depth {depth}: FlatWhip - {measure(FlatWhip, depth)}')
+
+assert isinstance(FlatWhip(Latte()), CondimentDecorator)
+assert Whip(Whip(Latte())).cost() == FlatWhip(FlatWhip(Latte())).cost()
+assert (Whip(Whip(Latte())).get_description() 
+        == FlatWhip(FlatWhip(Latte())).get_description())
+
+
+# Если заказов миллионы, строить на каждый цепочку объектов только ради 
+# cost() слишком дорого. Заказы удобнее хранить колонками: номер базового 
+# напитка и по колонке на каждую добавку с её количеством. Различных 
+# комбинаций в таких данных обычно немного, поэтому каждая считается один 
+# раз по настоящей объектной модели - так результат гарантированно совпадает 
+# с декораторами, включая порядок сложения float, - а затем результаты 
+# раскладываются по всем заказам колонкой array('d').
+# Добавки применяются в порядке колонок: сначала все добавки первой 
+# колонки, затем второй и т.д.
+
+import random
+from array import array
+
+
+class BulkPricer:
+
+    def __init__(self, beverages: list, condiments: list) -> None:
+        self._beverages = list(beverages)
+        self._condiments = list(condiments)
+        self._prices = {}
+
+    def _price_combination(self, key: tuple) -> tuple:
+        beverage = self._beverages[key[0]]()
+        for condiment, count in zip(self._condiments, key[1:]):
+            for _ in range(count):
+                beverage = condiment(beverage)
+
+        return beverage.cost(), beverage.get_description()
+
+    def price(self, base_ids, condiment_counts) -> tuple:
+        """Возвращает колонку стоимостей array('d') и список описаний.
+
+        base_ids - индексы в списке напитков, condiment_counts - по 
+        колонке количеств на каждую добавку.
+        """
+        prices = self._prices
+        for key in set(zip(base_ids, *condiment_counts)):
+            if key not in prices:
+                prices[key] = self._price_combination(key)
+
+        priced = list(map(prices.__getitem__, 
+                          zip(base_ids, *condiment_counts)))
+        costs = array('d', [cost for cost, _ in priced])
+        descriptions = [description for _, description in priced]
+        return costs, descriptions
+
+
+# Сравним с объектным путём на 200 тысячах заказов
+
+orders_count = 200_000
+base_ids = array('B', bytes(orders_count))
+whip_counts = array('B', [random.randint(0, 5) for _ in range(orders_count)])
+
+beverages = [Latte]
+start = time.perf_counter()
+object_costs = []
+object_descriptions = []
+for base_id, whips in zip(base_ids, whip_counts):
+    beverage = beverages[base_id]()
+    for _ in range(whips):
+        beverage = Whip(beverage)
+    object_costs.append(beverage.cost())
+    object_descriptions.append(beverage.get_description())
+object_elapsed = time.perf_counter() - start
+
+pricer = BulkPricer(beverages, [Whip])
+start = time.perf_counter()
+bulk_costs, bulk_descriptions = pricer.price(base_ids, [whip_counts])
+bulk_elapsed = time.perf_counter() - start
+
+assert list(bulk_costs) == object_costs
+assert bulk_descriptions == object_descriptions
+print(f'objects: {orders_count / object_elapsed:,.0f} orders/s')
+print(f'bulk: {orders_count / bulk_elapsed:,.0f} orders/s')
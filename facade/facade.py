@@ -52,3 +52,962 @@ network_loader = NetworkLoader()
 file_manager = FileManager()
 facade = UrlReceiverFacade(network_loader, file_manager)
 facade.receive_img_and_save('http://', 'c:\\users\\123.png')
+
+
+# Когда картинок становится много, обрабатывать их по одной слишком долго: 
+# каждый вызов receive_img_and_save сначала ждёт сеть, затем ресайз, затем 
+# диск. Фасад позволяет спрятать пакетную обработку за таким же простым 
+# интерфейсом - клиент по-прежнему передаёт только пары (url, путь).
+
+import asyncio
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+class PooledNetworkLoader(NetworkLoader):
+    """Загрузчик, переиспользующий keep-alive соединения.
+
+    HTTPConnection нельзя делить между потоками, поэтому у каждого потока свой 
+    набор соединений - по одному на хост.
+    """
+
+    def __init__(self, timeout: float = 10.0) -> None:
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _get_connection(self, scheme: str, netloc: str):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc, 
+                                                   timeout=self._timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, 
+                                                  timeout=self._timeout)
+            connections[(scheme, netloc)] = conn
+
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str, conn) -> None:
+        conn.close()
+        if self._local.connections.get((scheme, netloc)) is conn:
+            del self._local.connections[(scheme, netloc)]
+
+    def load_from_url(self, url: str) -> bytes:
+        response, data = self.fetch(url)
+        if response.status != 200:
+            raise http.client.HTTPException(
+                f'{response.status} {response.reason}')
+
+        return data
+
+    def fetch(self, url: str, headers: dict = None):
+        """Выполняет GET и возвращает ответ вместе с прочитанным телом"""
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        try:
+            return self._request(parts, target, headers or {})
+        except (http.client.RemoteDisconnected, ConnectionError):
+            # Сервер мог закрыть простаивающее соединение, переподключаемся 
+            # один раз
+            return self._request(parts, target, headers or {})
+
+    def _request(self, parts, target: str, headers: dict):
+        conn = self._get_connection(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', target, headers=headers)
+            response = conn.getresponse()
+            # Тело нужно дочитать полностью, иначе соединение нельзя 
+            # переиспользовать
+            return response, response.read()
+        except BaseException:
+            # После ошибки, например таймаута чтения, соединение застревает 
+            # посреди запроса и все следующие запросы на нём падают с 
+            # CannotSendRequest, поэтому его выбрасываем
+            self._drop_connection(parts.scheme, parts.netloc, conn)
+            raise
+
+
+class BatchUrlReceiverFacade(UrlReceiverFacade):
+    """Фасад с пакетной обработкой.
+
+    FileManager хранит состояние между load_bytes и save_file, поэтому 
+    каждой задаче нужен свой экземпляр - фасад получает фабрику, а не объект.
+    Число одновременных загрузок ограничено отдельно от числа потоков: пока 
+    одни потоки ждут сеть, другие успевают сделать ресайз и сохранение.
+    """
+
+    def __init__(self, network_loader: NetworkLoader, 
+                 file_manager_factory=FileManager, max_downloads: int = 8, 
+                 max_workers: int = None) -> None:
+        super().__init__(network_loader, file_manager_factory())
+        self._file_manager_factory = file_manager_factory
+        self._max_downloads = max_downloads
+        self._max_workers = max_workers or max_downloads * 2
+        self._download_slots = threading.BoundedSemaphore(max_downloads)
+
+    def _resize_and_save(self, net_data: bytes, path: str) -> None:
+        image = Image(net_data)
+        image.resize(250, 250)
+        file_manager = self._file_manager_factory()
+        file_manager.load_bytes(image.get_bytes())
+        file_manager.save_file(path)
+
+    def _receive_one(self, url: str, path: str):
+        try:
+            with self._download_slots:
+                net_data = self._net_loader.load_from_url(url)
+            self._resize_and_save(net_data, path)
+        except Exception as exc:
+            return exc
+
+    def receive_many(self, pairs) -> list:
+        """Обрабатывает пары (url, путь) пачкой.
+
+        Возвращает список того же размера: None для успешной пары или 
+        исключение, из-за которого она не обработалась.
+        """
+        with ThreadPoolExecutor(self._max_workers) as executor:
+            futures = [executor.submit(self._receive_one, url, path) 
+                       for url, path in pairs]
+            return [future.result() for future in futures]
+
+    async def receive_many_async(self, pairs) -> list:
+        """То же самое для asyncio: загрузчик и ресайз остаются 
+        блокирующими и выполняются в пуле потоков, а ограничение на число 
+        загрузок держит семафор цикла событий."""
+        loop = asyncio.get_running_loop()
+        download_slots = asyncio.Semaphore(self._max_downloads)
+
+        async def receive_one(executor, url, path):
+            async with download_slots:
+                net_data = await loop.run_in_executor(
+                    executor, self._net_loader.load_from_url, url)
+            await loop.run_in_executor(
+                executor, self._resize_and_save, net_data, path)
+
+        with ThreadPoolExecutor(self._max_workers) as executor:
+            results = await asyncio.gather(
+                *(receive_one(executor, url, path) for url, path in pairs), 
+                return_exceptions=True)
+
+        return [result if isinstance(result, Exception) else None 
+                for result in results]
+
+
+# Сравним с последовательной обработкой на локальном сервере-заглушке, 
+# который отвечает с небольшой задержкой, как настоящая сеть.
+
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.01
+    payload = b'\x89PNG' + bytes(16 * 1024)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # Очередь подключений по умолчанию - 5, при параллельных загрузках 
+    # лишние SYN отбрасываются и клиент ждёт повторной отправки
+    request_queue_size = 128
+
+
+if __name__ == '__main__':
+    stub_server = StubServer(('127.0.0.1', 0), StubImageHandler)
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+    stub_url = f'http://127.0.0.1:{stub_server.server_address[1]}'
+    pairs = [(f'{stub_url}/{i}.png', f'{i}.png') for i in range(100)]
+
+    serial_facade = UrlReceiverFacade(PooledNetworkLoader(), FileManager())
+    start = time.perf_counter()
+    for url, path in pairs:
+        serial_facade.receive_img_and_save(url, path)
+    print(f'serial: {time.perf_counter() - start:.2f}s')
+
+    batch_facade = BatchUrlReceiverFacade(PooledNetworkLoader(), 
+                                          max_downloads=16)
+    start = time.perf_counter()
+    batch_facade.receive_many(pairs)
+    print(f'receive_many: {time.perf_counter() - start:.2f}s')
+
+    start = time.perf_counter()
+    asyncio.run(batch_facade.receive_many_async(pairs))
+    print(f'receive_many_async: {time.perf_counter() - start:.2f}s')
+
+    stub_server.shutdown()
+    stub_server.server_close()
+
+
+# Фасад скрывает и то, как данные проходят через подсистему. Сейчас картинка 
+# целиком лежит в памяти: в ответе сети, в Image, в результате get_bytes() и 
+# в FileManager - три-четыре полные копии. Для больших файлов лучше потоковый 
+# режим: куски ответа переиспользуют один буфер, передаются дальше как 
+# memoryview и сразу пишутся на диск, поэтому пиковая память на картинку 
+# ограничена размером куска, а не размером файла.
+
+import contextlib
+import os
+
+
+class StreamingNetworkLoader(PooledNetworkLoader):
+
+    def __init__(self, timeout: float = 10.0, 
+                 chunk_size: int = 64 * 1024) -> None:
+        super().__init__(timeout)
+        self._chunk_size = chunk_size
+
+    def iter_chunks(self, url: str):
+        """Отдаёт ответ кусками.
+
+        Каждый кусок - memoryview на общий буфер, он действителен только до 
+        получения следующего куска, поэтому его нужно сразу обработать.
+        """
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        try:
+            conn, response = self._open(parts, target)
+        except (http.client.RemoteDisconnected, ConnectionError):
+            conn, response = self._open(parts, target)
+
+        buffer = bytearray(self._chunk_size)
+        view = memoryview(buffer)
+        try:
+            while True:
+                read = response.readinto(buffer)
+                if not read:
+                    break
+                yield view[:read]
+        finally:
+            view.release()
+            if not response.isclosed():
+                # Недочитанный ответ ломает keep-alive соединение
+                self._drop_connection(parts.scheme, parts.netloc, conn)
+
+    def _open(self, parts, target: str):
+        conn = self._get_connection(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', target)
+            response = conn.getresponse()
+            if response.status == 200:
+                return conn, response
+            response.read()
+        except BaseException:
+            self._drop_connection(parts.scheme, parts.netloc, conn)
+            raise
+
+        raise http.client.HTTPException(f'{response.status} {response.reason}')
+
+
+class StreamingImage(Image):
+    """Картинка, которая не собирается в памяти целиком.
+
+    resize только запоминает размер, а преобразование выполняется по ходу 
+    чтения кусков в iter_chunks - так работают построчные кодеки.
+    """
+
+    def __init__(self, chunks) -> None:
+        self._chunks = chunks
+        self._size = None
+
+    def resize(self, width, height):
+        self._size = (width, height)
+
+    def iter_chunks(self):
+        for chunk in self._chunks:
+            # Здесь кодек масштабирует очередную порцию строк
+            yield chunk
+
+
+class StreamingFileManager(FileManager):
+
+    def save_chunks(self, path: str, chunks) -> None:
+        # Пишем во временный файл и подменяем им целевой, чтобы при обрыве 
+        # загрузки не остался наполовину записанный файл
+        tmp_path = path + '.part'
+        try:
+            with open(tmp_path, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class StreamingUrlReceiverFacade(BatchUrlReceiverFacade):
+    """Фасад с потоковым режимом.
+
+    Загрузка и сохранение идут одновременно, поэтому слот загрузки занят, 
+    пока картинка не записана на диск.
+    """
+
+    def __init__(self, network_loader: StreamingNetworkLoader, 
+                 file_manager_factory=StreamingFileManager, 
+                 max_downloads: int = 8, max_workers: int = None) -> None:
+        super().__init__(network_loader, file_manager_factory, 
+                         max_downloads, max_workers or max_downloads)
+
+    def _stream(self, url: str, path: str, file_manager) -> None:
+        # Если сохранение упадёт посреди ответа, генератор нужно закрыть 
+        # явно: иначе его кадр живёт в traceback исключения, а недочитанное 
+        # соединение остаётся в пуле и ломает следующую загрузку потока
+        with contextlib.closing(self._net_loader.iter_chunks(url)) as chunks:
+            image = StreamingImage(chunks)
+            image.resize(250, 250)
+            file_manager.save_chunks(path, image.iter_chunks())
+
+    def receive_img_and_save(self, url: str, path: str) -> None:
+        self._stream(url, path, self._file_manager)
+
+    def _receive_one(self, url: str, path: str):
+        try:
+            with self._download_slots:
+                self._stream(url, path, self._file_manager_factory())
+        except Exception as exc:
+            return exc
+
+    async def receive_many_async(self, pairs) -> list:
+        # Загрузка и запись не разделяются на шаги, поэтому достаточно 
+        # вынести пакетную обработку из цикла событий
+        return await asyncio.to_thread(self.receive_many, pairs)
+
+
+# Сравним пиковую память на одной большой картинке
+
+import tempfile
+import tracemalloc
+
+
+class BigStubImageHandler(StubImageHandler):
+
+    latency = 0
+    payload = bytes(8 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    stub_server = StubServer(('127.0.0.1', 0), BigStubImageHandler)
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+    stub_url = f'http://127.0.0.1:{stub_server.server_address[1]}/big.png'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tracemalloc.start()
+        buffered_facade = UrlReceiverFacade(PooledNetworkLoader(), 
+                                            FileManager())
+        buffered_facade.receive_img_and_save(stub_url, 
+                                             os.path.join(tmp_dir, 'big.png'))
+        peak = tracemalloc.get_traced_memory()[1]
+        print(f'buffered peak: {peak // 1024} KiB')
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        streaming_facade = StreamingUrlReceiverFacade(StreamingNetworkLoader())
+        streaming_facade.receive_img_and_save(stub_url, 
+                                              os.path.join(tmp_dir, 'big.png'))
+        peak = tracemalloc.get_traced_memory()[1]
+        print(f'streaming peak: {peak // 1024} KiB')
+        tracemalloc.stop()
+
+    stub_server.shutdown()
+    stub_server.server_close()
+
+
+# Одни и те же картинки запрашиваются снова и снова. Загрузчик можно обернуть 
+# в кэширующий - фасад и клиент этого даже не заметят. Кэш хранится на диске:
+# содержимое лежит в objects/ под своим хэшем (одинаковые картинки с разных 
+# адресов хранятся один раз), а index/ связывает хэш адреса с хэшем 
+# содержимого и валидаторами ETag/Last-Modified.
+# Кэш могут делить несколько процессов: файлы пишутся во временные и 
+# подменяются атомарным os.replace, а пропавший из-под ног файл (его вытеснил 
+# соседний процесс) считается обычным промахом.
+
+import hashlib
+import json
+
+
+class CacheStats:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 
+                    'revalidations': self.revalidations, 
+                    'evictions': self.evictions}
+
+
+class CachingNetworkLoader(NetworkLoader):
+    """Кэширующий заместитель загрузчика.
+
+    max_bytes - бюджет на содержимое кэша, при превышении вытесняются давно 
+    не использованные объекты (время использования - mtime файла). 
+    max_age - сколько секунд ответ считается свежим и отдаётся без 
+    перепроверки на сервере.
+    """
+
+    def __init__(self, loader: PooledNetworkLoader, cache_dir: str, 
+                 max_bytes: int = 1024 ** 3, max_age: float = 0) -> None:
+        self._loader = loader
+        self._objects_dir = os.path.join(cache_dir, 'objects')
+        self._index_dir = os.path.join(cache_dir, 'index')
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._index_dir, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._size_lock = threading.Lock()
+        # Другие процессы тоже меняют кэш, поэтому это лишь оценка, 
+        # точный размер считается при вытеснении
+        self._approx_size = self._scan_size()
+        self.stats = CacheStats()
+
+    def load_from_url(self, url: str) -> bytes:
+        index_path = os.path.join(
+            self._index_dir, hashlib.sha256(url.encode()).hexdigest())
+        entry = self._read_json(index_path)
+        data = self._read_object(entry['digest']) if entry else None
+        if data is None:
+            return self._fetch(url, index_path, {})
+
+        if time.time() - entry['validated_at'] < self._max_age:
+            self.stats.add('hits')
+            return data
+
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return self._fetch(url, index_path, headers, entry, data)
+
+    def _fetch(self, url, index_path, headers, entry=None, cached=None):
+        response, data = self._loader.fetch(url, headers)
+        if response.status == 304 and cached is not None:
+            self.stats.add('hits')
+            self.stats.add('revalidations')
+            entry['validated_at'] = time.time()
+            self._write_json(index_path, entry)
+            return cached
+
+        if response.status != 200:
+            raise http.client.HTTPException(
+                f'{response.status} {response.reason}')
+
+        self.stats.add('misses')
+        digest = hashlib.sha256(data).hexdigest()
+        self._write_object(digest, data)
+        self._write_json(index_path, {
+            'url': url, 
+            'digest': digest, 
+            'etag': response.getheader('ETag'),
+            'last_modified': response.getheader('Last-Modified'),
+            'validated_at': time.time(),
+        })
+        return data
+
+    def _read_object(self, digest: str):
+        path = os.path.join(self._objects_dir, digest)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            # Отмечаем использование для LRU
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return data
+
+    def _write_object(self, digest: str, data: bytes) -> None:
+        path = os.path.join(self._objects_dir, digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+
+        self._atomic_write(path, data)
+        with self._size_lock:
+            self._approx_size += len(data)
+            over_budget = self._approx_size > self._max_bytes
+
+        if over_budget:
+            self._evict()
+
+    def _evict(self) -> None:
+        objects = []
+        for dir_entry in os.scandir(self._objects_dir):
+            if dir_entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = dir_entry.stat()
+            except FileNotFoundError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, dir_entry.path))
+
+        total = sum(size for _, size, _ in objects)
+        objects.sort()
+        for _, size, path in objects:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.stats.add('evictions')
+            except FileNotFoundError:
+                # Уже удалён соседним процессом
+                pass
+            total -= size
+
+        # Записи индекса на удалённые объекты не чистим: при чтении они 
+        # превратятся в промах и будут перезаписаны
+        with self._size_lock:
+            self._approx_size = total
+
+    def _scan_size(self) -> int:
+        total = 0
+        for dir_entry in os.scandir(self._objects_dir):
+            try:
+                total += dir_entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _write_json(cls, path: str, entry: dict) -> None:
+        cls._atomic_write(path, json.dumps(entry).encode())
+
+    @staticmethod
+    def _read_json(path: str):
+        try:
+            with open(path, 'rb') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+
+# Проверим на заглушке, которая умеет отвечать 304 Not Modified
+
+class ETagStubImageHandler(StubImageHandler):
+
+    latency = 0
+    etag = '"v1"'
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        payload = self.payload + self.path.encode()
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == '__main__':
+    stub_server = StubServer(('127.0.0.1', 0), ETagStubImageHandler)
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+    stub_url = f'http://127.0.0.1:{stub_server.server_address[1]}'
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Бюджета хватает примерно на 10 картинок из 20
+        caching_loader = CachingNetworkLoader(
+            PooledNetworkLoader(), cache_dir, max_bytes=10 * 17 * 1024)
+        cached_facade = UrlReceiverFacade(caching_loader, FileManager())
+        # Восемь популярных картинок и редкие запросы остальных
+        for _ in range(3):
+            for i in range(20):
+                cached_facade.receive_img_and_save(f'{stub_url}/{i % 8}.png', 
+                                                   f'{i}.png')
+            for i in range(8, 12):
+                cached_facade.receive_img_and_save(f'{stub_url}/{i}.png', 
+                                                   f'{i}.png')
+        print(caching_loader.stats.as_dict())
+
+    stub_server.shutdown()
+    stub_server.server_close()
+
+
+# Ресайз - чисто вычислительная работа, и в потоках он упирается в GIL: сколько 
+# потоков ни запускай, работает одно ядро. Подсистему ресайза можно вынести в 
+# пул процессов, фасад от этого не меняется.
+# Чтобы не гонять пиксели через pickle туда и обратно, картинки одного размера 
+# складываются в один блок разделяемой памяти, а процессы получают только его 
+# имя и диапазон картинок, которые им нужно обработать. Для пакета заранее 
+# строится таблица соответствия пикселей (ближайший сосед), она общая для 
+# всех картинок пакета.
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from operator import itemgetter
+
+
+class RawImage(Image):
+    """Несжатая картинка: width * height пикселей по channels байт"""
+
+    def __init__(self, pixels: bytes, width: int, height: int, 
+                 channels: int = 3) -> None:
+        self._pixels = pixels
+        self.width = width
+        self.height = height
+        self.channels = channels
+
+    def get_bytes(self) -> bytes:
+        return self._pixels
+
+    def set_pixels(self, pixels: bytes, width: int, height: int) -> None:
+        self._pixels = pixels
+        self.width = width
+        self.height = height
+
+    def resize(self, width, height):
+        self.set_pixels(resize_pixels(self._pixels, self.width, self.height, 
+                                      self.channels, width, height), 
+                        width, height)
+
+
+def build_resize_map(width, height, channels, new_width, new_height):
+    """Строит таблицу ближайшего соседа: для каждой строки результата - 
+    смещение исходной строки, и общий для всех строк набор индексов байт."""
+    row_size = width * channels
+    rows = [(y * height // new_height) * row_size for y in range(new_height)]
+    columns = [(x * width // new_width) * channels + channel 
+               for x in range(new_width) for channel in range(channels)]
+    if len(columns) == 1:
+        # itemgetter с одним индексом возвращает число, а не кортеж
+        column = columns[0]
+        return rows, row_size, lambda row: (row[column],)
+
+    return rows, row_size, itemgetter(*columns)
+
+
+def resize_pixels(pixels, width, height, channels, new_width, new_height, 
+                  resize_map=None):
+    rows, row_size, pick_columns = resize_map or build_resize_map(
+        width, height, channels, new_width, new_height)
+    src = memoryview(pixels)
+    resized = bytearray()
+    prev_offset, prev_row = None, None
+    for offset in rows:
+        # При увеличении одна исходная строка повторяется несколько раз
+        if offset != prev_offset:
+            prev_offset = offset
+            prev_row = bytes(pick_columns(src[offset:offset + row_size]))
+        resized += prev_row
+
+    return bytes(resized)
+
+
+def _resize_shared_batch(src_name, dst_name, first, last, shape, new_shape):
+    width, height, channels = shape
+    new_width, new_height = new_shape
+    src_size = width * height * channels
+    dst_size = new_width * new_height * channels
+    resize_map = build_resize_map(width, height, channels, 
+                                  new_width, new_height)
+    # Блоки создаёт и удаляет родительский процесс, воркер только 
+    # подключается к ним по имени
+    src_shm = shared_memory.SharedMemory(name=src_name)
+    dst_shm = shared_memory.SharedMemory(name=dst_name)
+    try:
+        for idx in range(first, last):
+            src = src_shm.buf[idx * src_size:(idx + 1) * src_size]
+            dst_shm.buf[idx * dst_size:(idx + 1) * dst_size] = resize_pixels(
+                src, width, height, channels, new_width, new_height, 
+                resize_map)
+            src.release()
+    finally:
+        src_shm.close()
+        dst_shm.close()
+
+
+class ProcessPoolResizeEngine:
+    """Ресайз картинок в пуле процессов через разделяемую память"""
+
+    def __init__(self, workers: int = None) -> None:
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(self._workers)
+
+    def resize(self, image: RawImage, width: int, height: int) -> None:
+        self.resize_many([image], width, height)
+
+    def resize_many(self, images: list, width: int, height: int) -> None:
+        """Меняет размер у пачки картинок, картинки группируются по 
+        исходному размеру и каждая группа обрабатывается одним пакетом"""
+        groups = {}
+        for image in images:
+            shape = (image.width, image.height, image.channels)
+            groups.setdefault(shape, []).append(image)
+
+        for shape, group in groups.items():
+            self._resize_group(group, shape, (width, height))
+
+    def _resize_group(self, group, shape, new_shape):
+        src_size = shape[0] * shape[1] * shape[2]
+        dst_size = new_shape[0] * new_shape[1] * shape[2]
+        src_shm = shared_memory.SharedMemory(create=True, 
+                                             size=src_size * len(group))
+        dst_shm = shared_memory.SharedMemory(create=True, 
+                                             size=dst_size * len(group))
+        try:
+            for idx, image in enumerate(group):
+                src_shm.buf[idx * src_size:(idx + 1) * src_size] = \
+                    image.get_bytes()
+
+            step = -(-len(group) // self._workers)
+            futures = [
+                self._executor.submit(
+                    _resize_shared_batch, src_shm.name, dst_shm.name, first, 
+                    min(first + step, len(group)), shape, new_shape)
+                for first in range(0, len(group), step)
+            ]
+            for future in futures:
+                future.result()
+
+            for idx, image in enumerate(group):
+                image.set_pixels(
+                    bytes(dst_shm.buf[idx * dst_size:(idx + 1) * dst_size]), 
+                    *new_shape)
+        finally:
+            src_shm.close()
+            src_shm.unlink()
+            dst_shm.close()
+            dst_shm.unlink()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+
+
+# Процессы-воркеры на Windows и macOS запускаются через spawn и заново 
+# импортируют этот файл, поэтому этот и остальные замеры в файле спрятаны под 
+# __main__ - иначе каждый воркер повторял бы их все
+
+if __name__ == '__main__':
+    source = bytes(range(256)) * (500 * 500 * 3 // 256 + 1)
+    source = source[:500 * 500 * 3]
+
+    def make_images():
+        return [RawImage(source, 500, 500) for _ in range(32)]
+
+    images = make_images()
+    start = time.perf_counter()
+    for image in images:
+        image.resize(250, 250)
+    print(f'inline resize: {time.perf_counter() - start:.2f}s')
+    expected = images[0].get_bytes()
+
+    for workers in (1, 2, 4, 8):
+        engine = ProcessPoolResizeEngine(workers)
+        # Прогреваем пул, чтобы не учитывать запуск процессов
+        engine.resize(RawImage(bytes(3), 1, 1), 1, 1)
+        images = make_images()
+        start = time.perf_counter()
+        engine.resize_many(images, 250, 250)
+        elapsed = time.perf_counter() - start
+        engine.shutdown()
+        assert images[-1].get_bytes() == expected
+        print(f'process pool, {workers} workers: {elapsed:.2f}s')
+
+
+# Чтобы понять, где фасад теряет время, этапы конвейера можно измерять: 
+# загрузка, декодирование, ресайз и сохранение. Замеры опциональны - без 
+# объекта метрик фасад работает по старому пути и ничего не измеряет.
+
+import math
+
+
+class LatencyHistogram:
+    """Гистограмма с логарифмическими корзинами.
+
+    Соседние границы отличаются в 2 ** (1/8) раз, поэтому перцентили 
+    получаются с погрешностью около 9% при постоянной памяти.
+    """
+
+    _base = 1e-6
+    _growth = 2 ** 0.125
+
+    def __init__(self) -> None:
+        self._buckets = {}
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        if seconds <= self._base:
+            idx = 0
+        else:
+            idx = int(math.log(seconds / self._base, self._growth)) + 1
+        self._buckets[idx] = self._buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, percent: float) -> float:
+        """Верхняя граница корзины, в которую попал перцентиль"""
+        if not self.count:
+            return 0.0
+
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for idx in sorted(self._buckets):
+            seen += self._buckets[idx]
+            if seen >= rank:
+                break
+
+        return self._base * self._growth ** idx
+
+
+class PipelineMetrics:
+    """Метрики этапов конвейера.
+
+    sink - необязательная функция sink(name, value), в которую дублируется 
+    каждый замер: длительность этапа в секундах или число байт.
+    """
+
+    stages = ('load', 'decode', 'resize', 'save')
+
+    def __init__(self, sink=None) -> None:
+        self._lock = threading.Lock()
+        self._sink = sink
+        self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.histograms[stage].add(seconds)
+        if self._sink is not None:
+            self._sink(stage, seconds)
+
+    def add_bytes(self, bytes_in: int, bytes_out: int) -> None:
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+        if self._sink is not None:
+            self._sink('bytes_in', bytes_in)
+            self._sink('bytes_out', bytes_out)
+
+    def report(self) -> str:
+        lines = [f'{"stage":<8}{"count":>8}{"p50, ms":>10}'
+                 f'{"p95, ms":>10}{"p99, ms":>10}']
+        with self._lock:
+            for stage, histogram in self.histograms.items():
+                lines.append(
+                    f'{stage:<8}{histogram.count:>8}' + ''.join(
+                        f'{histogram.percentile(percent) * 1000:>10.3f}' 
+                        for percent in (50, 95, 99)))
+            lines.append(f'bytes in: {self.bytes_in}, '
+                         f'bytes out: {self.bytes_out}')
+
+        return '\n'.join(lines)
+
+
+class InstrumentedUrlReceiverFacade(UrlReceiverFacade):
+    """Фасад с замерами этапов.
+
+    image_factory превращает полученные байты в картинку - это и есть этап 
+    декодирования.
+    """
+
+    def __init__(self, network_loader: NetworkLoader, 
+                 file_manager: FileManager, 
+                 metrics: PipelineMetrics = None, 
+                 image_factory=Image) -> None:
+        super().__init__(network_loader, file_manager)
+        self.metrics = metrics
+        self._image_factory = image_factory
+
+    def receive_img_and_save(self, url: str, path: str) -> None:
+        if self.metrics is None:
+            image = self._image_factory(self._net_loader.load_from_url(url))
+            image.resize(250, 250)
+            self._file_manager.load_bytes(image.get_bytes())
+            self._file_manager.save_file(path)
+            return
+
+        record = self.metrics.record
+        clock = time.perf_counter
+        start = clock()
+        net_data = self._net_loader.load_from_url(url)
+        loaded = clock()
+        record('load', loaded - start)
+        image = self._image_factory(net_data)
+        decoded = clock()
+        record('decode', decoded - loaded)
+        image.resize(250, 250)
+        resized = clock()
+        record('resize', resized - decoded)
+        out_data = image.get_bytes()
+        self._file_manager.load_bytes(out_data)
+        self._file_manager.save_file(path)
+        record('save', clock() - resized)
+        self.metrics.add_bytes(len(net_data), len(out_data or b''))
+
+
+class RawStubImageHandler(StubImageHandler):
+
+    latency = 0.002
+    payload = bytes(200 * 200 * 3)
+
+
+if __name__ == '__main__':
+    stub_server = StubServer(('127.0.0.1', 0), RawStubImageHandler)
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+    stub_url = f'http://127.0.0.1:{stub_server.server_address[1]}'
+
+    sink_calls = []
+    instrumented_facade = InstrumentedUrlReceiverFacade(
+        PooledNetworkLoader(), FileManager(), 
+        PipelineMetrics(sink=lambda name, value: sink_calls.append(name)), 
+        image_factory=lambda data: RawImage(data, 200, 200))
+    for i in range(100):
+        instrumented_facade.receive_img_and_save(f'{stub_url}/{i}.raw', 
+                                                 f'{i}.raw')
+    print(instrumented_facade.metrics.report())
+    print(f'sink calls: {len(sink_calls)}')
+
+    stub_server.shutdown()
+    stub_server.server_close()
@@ -166,3 +166,786 @@ class WeatherData(ISubject):
                 observer.update(self, additional_args)
 
             self._clear_changed()
+
+
+# Соберём субъект из примеров выше целиком, дальше он будет основой для 
+# других способов оповещения.
+
+class WeatherData(ISubject):
+
+    def __init__(self):
+        self._temperature = None
+        self._humidity = None
+        self._pressure = None
+        self._subscribers = set()
+        self._state_changed = False
+
+    def _set_changed(self):
+        self._state_changed = True
+
+    def _clear_changed(self):
+        self._state_changed = False
+
+    def set_measurements(self, temperature, humidity, pressure):
+        if (self._temperature is None 
+                or abs(temperature - self._temperature) >= 0.5):
+            self._set_changed()
+        self._temperature = temperature
+        self._humidity = humidity
+        self._pressure = pressure
+        self.notify()
+
+    def subscribe(self, observer: IObserver):
+        self._subscribers.add(observer)
+
+    def unsubscribe(self, observer: IObserver):
+        self._subscribers.discard(observer)
+
+    def notify(self, additional_args = None):
+        if self.has_changed:
+            for observer in self._subscribers:
+                observer.update(self, additional_args)
+
+            self._clear_changed()
+
+    @property
+    def has_changed(self):
+        return self._state_changed
+
+    @property        
+    def temperature(self):
+        return self._temperature
+    
+    @property
+    def humidity(self):
+        return self._humidity
+    
+    @property
+    def pressure(self):
+        return self._pressure
+
+
+# notify вызывает наблюдателей по очереди в потоке датчика, поэтому один 
+# медленный дисплей задерживает и чтение датчиков, и всех остальных 
+# подписчиков. Оповещения можно доставлять в пуле потоков: у каждого 
+# наблюдателя свой почтовый ящик ограниченного размера, notify только 
+# кладёт в ящики снимок показаний, а разбирает ящик один поток пула за раз.
+# Если наблюдатель не успевает, ящик либо схлопывает оповещения до 
+# последнего ('coalesce'), либо выбрасывает самые старые ('drop'). 
+# Наблюдатель, который обработал оповещение дольше timeout, считается 
+# медленным и переводится в отдельный пул: так даже много медленных 
+# наблюдателей не занимают потоки основного пула, и быстрые получают 
+# оповещения вовремя. Как только медленный наблюдатель снова укладывается в 
+# timeout, он возвращается в основной пул. Прервать поток в Python нельзя, 
+# поэтому уже начатый update всё равно доработает в своём потоке. 
+# Каждое оповещение, обработка которого вышла за timeout, считается в 
+# timeouts один раз.
+# Показания за время доставки могут измениться, поэтому наблюдатель 
+# получает их снимок в additional_args.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Mailbox:
+
+    def __init__(self, observer: IObserver, executor, slow_executor, 
+                 maxsize: int, policy: str, timeout: float) -> None:
+        if policy not in ('coalesce', 'drop'):
+            raise ValueError(f'Unknown mailbox policy: {policy}')
+        self.observer = observer
+        self._executors = (executor, slow_executor)
+        self._items = deque(maxlen=1 if policy == 'coalesce' else maxsize)
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._busy_since = None
+        self._timed_out = False
+        self.slow = False
+        self.dropped = 0
+        self.timeouts = 0
+
+    def post(self, subject, args) -> None:
+        with self._lock:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(args)
+            if self._scheduled:
+                self._check_timeout()
+                return
+            self._scheduled = True
+            executor = self._executors[self.slow]
+
+        executor.submit(self._drain, subject)
+
+    def _check_timeout(self) -> None:
+        """Засчитывает таймаут текущего оповещения, вызывается под 
+        блокировкой"""
+        if (self._busy_since is not None and not self._timed_out 
+                and time.perf_counter() - self._busy_since > self._timeout):
+            self._timed_out = True
+            self.timeouts += 1
+
+    def _drain(self, subject) -> None:
+        while True:
+            with self._lock:
+                if not self._items:
+                    self._scheduled = False
+                    return
+                args = self._items.popleft()
+                self._busy_since = time.perf_counter()
+                self._timed_out = False
+
+            try:
+                self.observer.update(subject, args)
+            except Exception:
+                # Ошибка одного наблюдателя не должна останавливать 
+                # доставку остальным
+                pass
+
+            with self._lock:
+                self._check_timeout()
+                self._busy_since = None
+                if self._timed_out == self.slow:
+                    continue
+                # Наблюдатель переходит в другой пул, а поток текущего 
+                # освобождается
+                self.slow = self._timed_out
+                if not self._items:
+                    self._scheduled = False
+                    return
+                executor = self._executors[self.slow]
+
+            executor.submit(self._drain, subject)
+            return
+
+
+class ConcurrentWeatherData(WeatherData):
+
+    def __init__(self, max_workers: int = 8, maxsize: int = 16, 
+                 policy: str = 'coalesce', timeout: float = 1.0, 
+                 slow_workers: int = 4):
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._slow_executor = ThreadPoolExecutor(slow_workers)
+        self._maxsize = maxsize
+        self._policy = policy
+        self._timeout = timeout
+        self._mailboxes = {}
+
+    def subscribe(self, observer: IObserver, policy: str = None):
+        self._mailboxes[observer] = Mailbox(
+            observer, self._executor, self._slow_executor, self._maxsize, 
+            policy or self._policy, self._timeout)
+
+    def unsubscribe(self, observer: IObserver):
+        self._mailboxes.pop(observer, None)
+
+    def notify(self, additional_args = None):
+        if self.has_changed:
+            args = {'temperature': self._temperature, 
+                    'humidity': self._humidity, 
+                    'pressure': self._pressure}
+            if additional_args:
+                args.update(additional_args)
+            for mailbox in list(self._mailboxes.values()):
+                mailbox.post(self, args)
+
+            self._clear_changed()
+
+    def mailbox_stats(self) -> dict:
+        mailboxes = list(self._mailboxes.values())
+        return {'dropped': sum(mailbox.dropped for mailbox in mailboxes), 
+                'timeouts': sum(mailbox.timeouts for mailbox in mailboxes), 
+                'slow': sum(mailbox.slow for mailbox in mailboxes)}
+
+    def close(self):
+        self._executor.shutdown()
+        self._slow_executor.shutdown()
+
+
+# Замерим, сколько датчик ждёт notify, когда каждый сотый наблюдатель 
+# тратит на обновление 20 мс
+
+class CountingObserver(IObserver):
+
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.updates = 0
+
+    def update(self, subject: ISubject, additional_args: dict = None):
+        if self.delay:
+            time.sleep(self.delay)
+        self.updates += 1
+
+
+def producer_latency(weather_data, observers_count, notifications=20):
+    observers = [CountingObserver(0.02 if idx % 100 == 99 else 0) 
+                 for idx in range(observers_count)]
+    for observer in observers:
+        weather_data.subscribe(observer)
+
+    start = time.perf_counter()
+    for idx in range(notifications):
+        # Каждое измерение отличается на градус, чтобы оповещать всегда
+        weather_data.set_measurements(20 + idx, 50, 760)
+    return (time.perf_counter() - start) / notifications
+
+
+for observers_count in (1, 100, 10_000):
+    # Последовательно 10 тысяч наблюдателей - это 2 секунды на каждый notify
+    if observers_count <= 100:
+        serial = producer_latency(WeatherData(), observers_count)
+        serial = f'{serial * 1000:.2f} ms'
+    else:
+        serial = 'skipped'
+    concurrent_data = ConcurrentWeatherData(timeout=0.01)
+    concurrent = producer_latency(concurrent_data, observers_count)
+    concurrent_data.close()
+    print(f'{observers_count} observers: serial notify {serial}, '
+          f'concurrent notify {concurrent * 1000:.2f} ms, '
+          f'{concurrent_data.mailbox_stats()}')
+
+
+# Теперь медленных наблюдателей (по 50 мс на обновление) вдвое больше, чем 
+# потоков в основном пуле. Быстрые наблюдатели всё равно получают 
+# оповещения за миллисекунды: медленные после первого же таймаута уходят в 
+# отдельный пул.
+
+class DelayObserver(IObserver):
+
+    def __init__(self, sent_at: dict) -> None:
+        self._sent_at = sent_at
+        self.delays = []
+
+    def update(self, subject: ISubject, additional_args: dict = None):
+        sent_at = self._sent_at[additional_args['temperature']]
+        self.delays.append(time.perf_counter() - sent_at)
+
+
+sent_at = {}
+isolated_data = ConcurrentWeatherData(max_workers=8, timeout=0.01)
+for _ in range(16):
+    isolated_data.subscribe(CountingObserver(0.05))
+fast_observers = [DelayObserver(sent_at) for _ in range(100)]
+for observer in fast_observers:
+    isolated_data.subscribe(observer)
+for idx in range(50):
+    sent_at[20 + idx] = time.perf_counter()
+    isolated_data.set_measurements(20 + idx, 50, 760)
+    time.sleep(0.01)
+isolated_data.close()
+delays = sorted(delay for observer in fast_observers 
+                for delay in observer.delays)
+print(f'fast observers: {len(delays)} updates, '
+      f'p99 delay {delays[len(delays) * 99 // 100] * 1000:.1f} ms, '
+      f'{isolated_data.mailbox_stats()}')
+
+
+# Датчики могут присылать тысячи измерений в секунду, и даже с порогом 
+# has_changed каждое принятое изменение сразу уходит всем подписчикам. 
+# Многим подписчикам столько не нужно, поэтому у подписки может быть своя 
+# политика оповещения - это компромисс между задержкой и числом оповещений:
+# - Immediate - как раньше, каждое изменение сразу;
+# - LatestOnly - не чаще раза в interval секунд, и только последнее значение;
+# - WindowBatch - все изменения за окно одним оповещением, списком в 
+# additional_args['batch'];
+# - RateLimit - не больше rate оповещений в секунду с запасом burst, 
+# лишние отбрасываются.
+# Отложенные оповещения доставляются при следующем измерении или по 
+# явному вызову flush, отдельного таймера нет.
+
+class Immediate:
+
+    def __init__(self, observer: IObserver) -> None:
+        self.observer = observer
+        self.delivered = 0
+
+    def push(self, subject, measurement: tuple, now: float) -> None:
+        self.delivered += 1
+        self.observer.update(subject, None)
+
+    def flush(self, subject, now: float, force: bool = False) -> None:
+        pass
+
+
+class LatestOnly(Immediate):
+
+    def __init__(self, observer: IObserver, interval: float) -> None:
+        super().__init__(observer)
+        self._interval = interval
+        self._last_delivery = float('-inf')
+        self._pending = None
+
+    def push(self, subject, measurement: tuple, now: float) -> None:
+        self._pending = measurement
+        self.flush(subject, now)
+
+    def flush(self, subject, now: float, force: bool = False) -> None:
+        if self._pending is None:
+            return
+        if force or now - self._last_delivery >= self._interval:
+            temperature, humidity, pressure = self._pending
+            self._pending = None
+            self._last_delivery = now
+            self.delivered += 1
+            self.observer.update(subject, {'temperature': temperature, 
+                                           'humidity': humidity, 
+                                           'pressure': pressure})
+
+
+class WindowBatch(Immediate):
+
+    def __init__(self, observer: IObserver, window: float) -> None:
+        super().__init__(observer)
+        self._window = window
+        self._window_start = None
+        self._batch = []
+
+    def push(self, subject, measurement: tuple, now: float) -> None:
+        self.flush(subject, now)
+        if self._window_start is None:
+            self._window_start = now
+        self._batch.append(measurement)
+
+    def flush(self, subject, now: float, force: bool = False) -> None:
+        if not self._batch:
+            return
+        if force or now - self._window_start >= self._window:
+            batch, self._batch = self._batch, []
+            self._window_start = None
+            self.delivered += 1
+            self.observer.update(subject, {'batch': batch})
+
+
+class RateLimit(Immediate):
+    """Ограничение по алгоритму token bucket"""
+
+    def __init__(self, observer: IObserver, rate: float, 
+                 burst: int = 1) -> None:
+        super().__init__(observer)
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = None
+        self.dropped = 0
+
+    def push(self, subject, measurement: tuple, now: float) -> None:
+        if self._updated is not None:
+            refill = (now - self._updated) * self._rate
+            self._tokens = min(self._burst, self._tokens + refill)
+        self._updated = now
+        if self._tokens < 1:
+            self.dropped += 1
+            return
+
+        self._tokens -= 1
+        super().push(subject, measurement, now)
+
+
+class PolicyWeatherData(WeatherData):
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__()
+        self._clock = clock
+        self._policies = {}
+
+    def subscribe(self, observer: IObserver, policy: Immediate = None):
+        """policy - уже созданная политика для этого наблюдателя"""
+        self._policies[observer] = policy or Immediate(observer)
+
+    def unsubscribe(self, observer: IObserver):
+        self._policies.pop(observer, None)
+
+    def notify(self, additional_args = None):
+        now = self._clock()
+        policies = list(self._policies.values())
+        if self.has_changed:
+            measurement = (self._temperature, self._humidity, self._pressure)
+            for policy in policies:
+                policy.push(self, measurement, now)
+            self._clear_changed()
+        else:
+            self.flush(force=False, now=now)
+
+    def flush(self, force: bool = True, now: float = None):
+        now = self._clock() if now is None else now
+        for policy in list(self._policies.values()):
+            policy.flush(self, now, force)
+
+
+# Минута измерений с частотой 1 кГц, время модельное
+
+class BatchSizeObserver(CountingObserver):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.measurements = 0
+
+    def update(self, subject: ISubject, additional_args: dict = None):
+        super().update(subject, additional_args)
+        if additional_args and 'batch' in additional_args:
+            self.measurements += len(additional_args['batch'])
+        else:
+            self.measurements += 1
+
+
+model_time = 0.0
+policy_data = PolicyWeatherData(clock=lambda: model_time)
+policies = {
+    'immediate': Immediate(BatchSizeObserver()),
+    'latest every 1s': LatestOnly(BatchSizeObserver(), interval=1.0),
+    'batch per 5s': WindowBatch(BatchSizeObserver(), window=5.0),
+    '2 per second': RateLimit(BatchSizeObserver(), rate=2, burst=5),
+}
+for policy in policies.values():
+    policy_data.subscribe(policy.observer, policy)
+
+for step in range(60_000):
+    model_time = step / 1000
+    # Порог в полградуса пропускает два измерения из трёх
+    temperature = 20.6 if step % 3 == 1 else 20.0
+    policy_data.set_measurements(temperature, 50, 760)
+policy_data.flush()
+
+for title, policy in policies.items():
+    print(f'{title}: {policy.delivered} notifications, '
+          f'{policy.observer.measurements} measurements delivered')
+
+
+# Каждый наблюдатель получает каждое оповещение и сам решает внутри update, 
+# интересно ли оно ему, а has_changed смотрит только на температуру с 
+# фиксированным порогом. При сотнях тысяч подписчиков дешевле, чтобы 
+# субъект знал условия подписчиков и вызывал только тех, чьё условие 
+# сработало. Подписка задаётся на конкретное поле и бывает двух видов:
+# - порог: оповещать, когда поле изменилось на threshold и больше с 
+# последнего оповещения. Подписчики с одинаковым порогом живут в одной 
+# корзине и оповещаются вместе, поэтому на каждое измерение проверяется 
+# по одному значению на корзину, а не на подписчика;
+# - диапазон: оповещать, когда значение входит в [low, high] или выходит из 
+# него. Границы хранятся в отсортированных списках, и bisect сразу находит 
+# только те границы, которые значение пересекло.
+# Обычные подписчики по-прежнему получают всё, что пропустил has_changed.
+
+from bisect import bisect_left, bisect_right, insort
+
+FIELDS = ('temperature', 'humidity', 'pressure')
+
+
+class ThresholdBucket:
+
+    def __init__(self) -> None:
+        self.reference = None
+        self.observers = set()
+
+
+class FieldIndex:
+
+    def __init__(self) -> None:
+        self.buckets = {}
+        # Отсортированные пары (граница, номер подписки)
+        self.lows = []
+        self.highs = []
+        self.ranges = {}
+        self._next_range_id = 0
+        # Подписки каждого наблюдателя: (пороги, номера диапазонов), чтобы 
+        # отписка не обходила весь индекс
+        self._subscriptions = {}
+        # Сколько границ удалённых диапазонов ещё лежит в lows и highs
+        self._removed = 0
+
+    def _subscription(self, observer) -> tuple:
+        return self._subscriptions.setdefault(observer, (set(), []))
+
+    def add_threshold(self, observer, threshold: float) -> None:
+        bucket = self.buckets.setdefault(threshold, ThresholdBucket())
+        bucket.observers.add(observer)
+        self._subscription(observer)[0].add(threshold)
+
+    def add_range(self, observer, low: float, high: float) -> int:
+        range_id = self._next_range_id
+        self._next_range_id += 1
+        self.ranges[range_id] = (observer, low, high)
+        insort(self.lows, (low, range_id))
+        insort(self.highs, (high, range_id))
+        self._subscription(observer)[1].append(range_id)
+        return range_id
+
+    def remove(self, observer) -> None:
+        thresholds, range_ids = self._subscriptions.pop(observer, ((), ()))
+        for threshold in thresholds:
+            bucket = self.buckets[threshold]
+            bucket.observers.discard(observer)
+            if not bucket.observers:
+                del self.buckets[threshold]
+
+        # Удаление из середины списка - это сдвиг всего хвоста, поэтому 
+        # границы удалённых диапазонов остаются на месте и fired их 
+        # пропускает, а списки пересобираются, когда таких границ становится 
+        # больше, чем живых
+        for range_id in range_ids:
+            del self.ranges[range_id]
+        self._removed += len(range_ids)
+        if self._removed > len(self.ranges):
+            self.lows = [item for item in self.lows if item[1] in self.ranges]
+            self.highs = [item for item in self.highs 
+                          if item[1] in self.ranges]
+            self._removed = 0
+
+    def fired(self, old, new):
+        for threshold, bucket in self.buckets.items():
+            reference = bucket.reference
+            if reference is None or abs(new - reference) >= threshold:
+                bucket.reference = new
+                yield from bucket.observers
+
+        if old is None:
+            # Первое измерение: оповещаем всех, в чей диапазон оно попало
+            last = bisect_right(self.lows, (new, float('inf')))
+            candidates = (range_id for _, range_id in self.lows[:last])
+        elif old == new:
+            return
+        else:
+            low_bound, high_bound = min(old, new), max(old, new)
+            # Нижняя граница пересечена, если она в (low_bound, high_bound], 
+            # верхняя - если в [low_bound, high_bound)
+            candidates = {range_id for _, range_id in self.lows[
+                bisect_right(self.lows, (low_bound, float('inf'))):
+                bisect_right(self.lows, (high_bound, float('inf')))]}
+            candidates.update(range_id for _, range_id in self.highs[
+                bisect_left(self.highs, (low_bound, -1)):
+                bisect_left(self.highs, (high_bound, -1))])
+
+        for range_id in candidates:
+            subscription = self.ranges.get(range_id)
+            if subscription is None:
+                continue
+            observer, low, high = subscription
+            was_inside = old is not None and low <= old <= high
+            if was_inside != (low <= new <= high):
+                yield observer
+
+
+class IndexedWeatherData(WeatherData):
+
+    def __init__(self):
+        super().__init__()
+        self._indexes = {field: FieldIndex() for field in FIELDS}
+        self._previous = dict.fromkeys(FIELDS)
+
+    def subscribe_field(self, observer: IObserver, field: str, 
+                        threshold: float = None, value_range: tuple = None):
+        """Подписка на поле с порогом изменения или диапазоном (low, high)"""
+        if (threshold is None) == (value_range is None):
+            raise ValueError('Pass either threshold or value_range')
+        if threshold is not None:
+            self._indexes[field].add_threshold(observer, threshold)
+        else:
+            self._indexes[field].add_range(observer, *value_range)
+
+    def unsubscribe(self, observer: IObserver):
+        super().unsubscribe(observer)
+        for index in self._indexes.values():
+            index.remove(observer)
+
+    def notify(self, additional_args = None):
+        super().notify(additional_args)
+
+        fired_fields = {}
+        for field, index in self._indexes.items():
+            new = getattr(self, field)
+            for observer in index.fired(self._previous[field], new):
+                fired_fields.setdefault(observer, []).append(field)
+            self._previous[field] = new
+
+        for observer, fields in fired_fields.items():
+            args = dict(additional_args or {}, fields=fields)
+            observer.update(self, args)
+
+
+# 100 тысяч подписчиков на температуру: половина с порогами, половина с 
+# диапазонами. Сравним с тем, как если бы каждый проверял условие сам.
+
+import random
+
+indexed_data = IndexedWeatherData()
+observers = [CountingObserver() for _ in range(100_000)]
+conditions = []
+for idx, observer in enumerate(observers):
+    if idx % 2:
+        threshold = random.choice((1, 2, 5, 10, 20))
+        indexed_data.subscribe_field(observer, 'temperature', 
+                                     threshold=threshold)
+        conditions.append(('threshold', threshold))
+    else:
+        low = random.uniform(-40, 40)
+        value_range = (low, low + random.uniform(1, 10))
+        indexed_data.subscribe_field(observer, 'temperature', 
+                                     value_range=value_range)
+        conditions.append(('range', value_range))
+
+temperatures = [20 + random.gauss(0, 0.3) for _ in range(50)]
+
+start = time.perf_counter()
+for temperature in temperatures:
+    indexed_data.set_measurements(temperature, 50, 760)
+indexed_elapsed = time.perf_counter() - start
+fired = sum(observer.updates for observer in observers)
+
+# Наивный вариант: каждое измерение проверяет условия всех подписчиков
+start = time.perf_counter()
+references = {}
+previous = None
+naive_fired = 0
+for temperature in temperatures:
+    for idx, (kind, condition) in enumerate(conditions):
+        if kind == 'threshold':
+            reference = references.get(idx)
+            if reference is None or abs(temperature - reference) >= condition:
+                references[idx] = temperature
+                naive_fired += 1
+        else:
+            low, high = condition
+            was_inside = previous is not None and low <= previous <= high
+            if was_inside != (low <= temperature <= high):
+                naive_fired += 1
+    previous = temperature
+naive_elapsed = time.perf_counter() - start
+
+assert fired == naive_fired
+print(f'{fired} notifications, indexed: {indexed_elapsed / 50 * 1000:.2f} ms '
+      f'per update, every subscriber checked: '
+      f'{naive_elapsed / 50 * 1000:.2f} ms per update')
+
+# Отписка касается только подписок самого наблюдателя
+start = time.perf_counter()
+for observer in observers[:50_000]:
+    indexed_data.unsubscribe(observer)
+for temperature in temperatures:
+    indexed_data.set_measurements(temperature, 50, 760)
+for observer in observers[50_000:]:
+    indexed_data.unsubscribe(observer)
+print(f'unsubscribed 100000 in {time.perf_counter() - start:.2f}s')
+
+
+# Субъект держит подписчиков сильными ссылками, поэтому наблюдатель, 
+# которого забыли отписать, живёт вечно вместе со всем, на что ссылается. В 
+# долгоживущих процессах это медленная утечка памяти. Реестр подписчиков 
+# может хранить слабые ссылки: когда на наблюдателя не остаётся других 
+# ссылок, он сам пропадает из реестра.
+# Реестр основан на dict: подписка и отписка за O(1), порядок подписки 
+# сохраняется, а notify обходит словарь напрямую, без копии списка. Чтобы 
+# обход не ломался, изменения во время оповещения (подписка, отписка, 
+# смерть наблюдателя) откладываются до его окончания.
+
+import gc
+import tracemalloc
+import weakref
+
+
+class WeakSubscriberRegistry:
+
+    def __init__(self) -> None:
+        self._refs = {}
+        self._notifying = 0
+        self._pending = []
+
+    def add(self, observer) -> None:
+        if self._notifying:
+            self._pending.append((self.add, observer))
+            return
+
+        # Ключ - id, а не сам объект: наблюдатели не обязаны быть 
+        # хэшируемыми. Мёртвую ссылку с тем же id просто заменяем.
+        key = id(observer)
+        ref = self._refs.get(key)
+        if ref is None or ref() is None:
+            self._refs[key] = weakref.ref(
+                observer, lambda ref, key=key: self._drop(key, ref))
+
+    def discard(self, observer) -> None:
+        if self._notifying:
+            self._pending.append((self.discard, observer))
+            return
+
+        key = id(observer)
+        ref = self._refs.get(key)
+        if ref is not None and ref() is observer:
+            del self._refs[key]
+
+    def _drop(self, key, ref) -> None:
+        if self._notifying:
+            self._pending.append((self._drop, key, ref))
+            return
+
+        # id мог достаться новому объекту, удаляем только свою ссылку
+        if self._refs.get(key) is ref:
+            del self._refs[key]
+
+    def notify(self, subject, additional_args=None) -> None:
+        self._notifying += 1
+        try:
+            for ref in self._refs.values():
+                observer = ref()
+                if observer is not None:
+                    observer.update(subject, additional_args)
+        finally:
+            self._notifying -= 1
+            if not self._notifying and self._pending:
+                pending, self._pending = self._pending, []
+                for method, *args in pending:
+                    method(*args)
+
+    def __len__(self):
+        return len(self._refs)
+
+
+class WeakWeatherData(WeatherData):
+
+    def __init__(self):
+        super().__init__()
+        self._subscribers = WeakSubscriberRegistry()
+
+    def subscribe(self, observer: IObserver):
+        self._subscribers.add(observer)
+
+    def unsubscribe(self, observer: IObserver):
+        self._subscribers.discard(observer)
+
+    def notify(self, additional_args = None):
+        if self.has_changed:
+            self._subscribers.notify(self, additional_args)
+            self._clear_changed()
+
+
+# Сутки работы: каждую модельную минуту появляются 50 временных дисплеев, 
+# которые никто не отписывает, приходит новое измерение, а температура 
+# меняется раз в час
+
+class TemporaryDisplay(CountingObserver):
+
+    def __init__(self) -> None:
+        super().__init__()
+        # То, что дисплей удерживает: буферы, соединения и т.д.
+        self.payload = bytearray(1024)
+
+
+def simulate_day(weather_data):
+    tracemalloc.start()
+    for minute in range(24 * 60):
+        for _ in range(50):
+            weather_data.subscribe(TemporaryDisplay())
+        weather_data.set_measurements(20 + minute // 60 % 2, 50, 760)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory
+
+
+for weather_data in (WeatherData(), WeakWeatherData()):
+    memory = simulate_day(weather_data)
+    print(f'{type(weather_data).__name__}: '
+          f'{len(weather_data._subscribers)} subscribers left, '
+          f'{memory / 1024 / 1024:.1f} MiB held')
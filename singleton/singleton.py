@@ -11,7 +11,9 @@ class Singleton:
     __instance = None
 
     def __new__(cls):
-        if not cls.__instance:
+        # Сравниваем именно с None: экземпляр с __bool__ или __len__ может 
+        # оказаться "ложным" и тогда создавался бы заново при каждом вызове
+        if cls.__instance is None:
             cls.__instance = super().__new__(cls)
         
         # Т.к. __new__ возвращает экземпляр, то для него каждый раз будет 
@@ -27,7 +29,7 @@ def singleton_decorator(class_):
     instance = None
     def get_instance_wrapper(*args, **kwargs):
         nonlocal instance
-        if not instance:
+        if instance is None:
             instance = class_(*args, **kwargs)
         return instance
     
@@ -49,11 +51,495 @@ class Singleton(type):
     __instance = None
 
     def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        if not self.__instance:
+        if self.__instance is None:
             self.__instance = super().__call__(*args, **kwargs)
 
         return self.__instance
 
 
 class A(metaclass=Singleton):
-    ...
\ No newline at end of file
+    ...
+
+# Ни один из способов выше не защищён от потоков: два потока могут 
+# одновременно увидеть, что экземпляра ещё нет, и создать по своему.
+# Поможет блокировка с двойной проверкой: пока экземпляр не создан, потоки 
+# проверяют его ещё раз уже под блокировкой, а после создания блокировка 
+# больше не берётся вовсе - остаётся только чтение из словаря.
+# Отдельная проблема - fork: дочерний процесс получает копию блокировки, 
+# которую в момент fork мог держать другой поток, и копию экземпляра, который 
+# может владеть сокетами или потоками родителя. Поэтому в дочернем процессе 
+# блокировки и экземпляры сбрасываются, и одиночка создаётся заново.
+
+import os
+import threading
+
+_MISSING = object()
+
+
+class ThreadSafeSingleton(type):
+
+    _instances = {}
+    _locks = {}
+    _locks_guard = threading.Lock()
+
+    def __call__(cls, *args: Any, **kwargs: Any) -> Any:
+        # Обращаемся через метакласс, чтобы атрибуты самого класса с такими 
+        # же именами ничего не сломали
+        instances = ThreadSafeSingleton._instances
+        instance = instances.get(cls, _MISSING)
+        if instance is not _MISSING:
+            return instance
+
+        with ThreadSafeSingleton._get_lock(cls):
+            instance = instances.get(cls, _MISSING)
+            if instance is _MISSING:
+                instance = super().__call__(*args, **kwargs)
+                instances[cls] = instance
+
+        return instance
+
+    def _get_lock(cls):
+        lock = ThreadSafeSingleton._locks.get(cls)
+        if lock is None:
+            # Отдельная блокировка на класс, чтобы долгое создание одного 
+            # одиночки не задерживало остальных
+            with ThreadSafeSingleton._locks_guard:
+                lock = ThreadSafeSingleton._locks.setdefault(
+                    cls, threading.Lock())
+        return lock
+
+    @staticmethod
+    def _reset_after_fork():
+        ThreadSafeSingleton._instances.clear()
+        ThreadSafeSingleton._locks.clear()
+        ThreadSafeSingleton._locks_guard = threading.Lock()
+
+
+def thread_safe_singleton_decorator(class_):
+    instance = _MISSING
+    lock = threading.Lock()
+
+    def get_instance_wrapper(*args, **kwargs):
+        nonlocal instance
+        if instance is _MISSING:
+            with lock:
+                if instance is _MISSING:
+                    instance = class_(*args, **kwargs)
+        return instance
+
+    def reset_after_fork():
+        nonlocal instance, lock
+        instance = _MISSING
+        lock = threading.Lock()
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=reset_after_fork)
+
+    return get_instance_wrapper
+
+
+# На Windows fork нет, там и сбрасывать нечего
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(
+        after_in_child=ThreadSafeSingleton._reset_after_fork)
+
+
+# Проверим под нагрузкой: 32 потока одновременно вызывают конструктор. 
+# Медленный __init__ расширяет окно гонки.
+
+import time
+
+
+def hammer(factory, threads=32, calls=10000):
+    barrier = threading.Barrier(threads)
+    instances = set()
+
+    def worker():
+        barrier.wait()
+        seen = {id(factory()) for _ in range(calls)}
+        instances.update(seen)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return len(instances), time.perf_counter() - start
+
+
+class SlowInit:
+
+    def __init__(self) -> None:
+        time.sleep(0.01)
+
+
+class Unsafe(SlowInit, metaclass=Singleton):
+    ...
+
+
+class Locked(SlowInit):
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        # Блокировка на каждый вызов, даже когда экземпляр давно создан
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                SlowInit.__init__(cls._instance)
+        return cls._instance
+
+    def __init__(self) -> None:
+        pass
+
+
+class DoubleChecked(SlowInit, metaclass=ThreadSafeSingleton):
+    ...
+
+
+for factory in (Unsafe, Locked, DoubleChecked):
+    count, elapsed = hammer(factory)
+    print(f'{factory.__name__}: {count} instance(s), {elapsed:.3f}s')
+
+
+# Одиночки часто оборачивают дорогие ресурсы: подключения, кэши, модели. 
+# Если создавать их при первом обращении, первый запрос получает всплеск 
+# задержки, а если при импорте - медленно стартует всё приложение. 
+# Компромиссов два:
+# - ленивый заместитель, который можно раздать заранее, а создаст он 
+# одиночку только при первом обращении к атрибуту;
+# - прогрев - независимые одиночки создаются параллельно при старте.
+# Оба способа принимают любую фабрику: класс с метаклассом-одиночкой или 
+# функцию, которую возвращает декоратор.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LazySingletonProxy:
+
+    def __init__(self, factory, *args: Any, **kwargs: Any) -> None:
+        # Пишем напрямую в __dict__, чтобы не попасть в __getattr__
+        self.__dict__['_factory'] = (factory, args, kwargs)
+
+    def get_instance(self) -> Any:
+        factory, args, kwargs = self.__dict__['_factory']
+        # Фабрика сама потокобезопасна и после создания отвечает без 
+        # блокировки, поэтому экземпляр можно не кэшировать в заместителе
+        return factory(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get_instance(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.get_instance(), name, value)
+
+
+def warm_up(*factories, max_workers: int = None) -> list:
+    """Параллельно создаёт независимые одиночки и возвращает их в том же 
+    порядке. Конструкторы обычно ждут сеть или диск, поэтому хватает 
+    потоков."""
+    with ThreadPoolExecutor(max_workers or len(factories) or 1) as executor:
+        return list(executor.map(lambda factory: factory(), factories))
+
+
+# Для асинхронных приложений дорогая часть инициализации - корутина. 
+# Конструктор не может её дождаться, поэтому класс описывает её в методе 
+# async_init, а получать экземпляр нужно через await Class.instance_async(). 
+# Одновременные вызовы ждут одну и ту же инициализацию, а если она упала 
+# или была отменена (например, цикл событий завершился, не дождавшись её) - 
+# следующий вызов попробует снова.
+# Синхронный вызов Class() вернёт тот же объект, но, возможно, ещё не 
+# инициализированный до конца.
+
+class AsyncSingleton(ThreadSafeSingleton):
+
+    _init_tasks = {}
+
+    @staticmethod
+    def _init_failed(task) -> bool:
+        return task.done() and (task.cancelled() 
+                                or task.exception() is not None)
+
+    async def instance_async(cls, *args: Any, **kwargs: Any) -> Any:
+        instance = cls(*args, **kwargs)
+        task = AsyncSingleton._init_tasks.get(cls)
+        if task is None or AsyncSingleton._init_failed(task):
+            task = asyncio.ensure_future(instance.async_init())
+            AsyncSingleton._init_tasks[cls] = task
+
+        try:
+            # shield - отмена одного ожидающего не должна отменять 
+            # инициализацию для остальных
+            await asyncio.shield(task)
+        except BaseException:
+            # Отмена самого ожидающего задачу не портит, а упавшую или 
+            # отменённую инициализацию убираем, чтобы её начали заново
+            if (AsyncSingleton._init_tasks.get(cls) is task 
+                    and AsyncSingleton._init_failed(task)):
+                del AsyncSingleton._init_tasks[cls]
+            raise
+
+        return instance
+
+
+# Экземпляры и блокировки сбросит хук ThreadSafeSingleton, задачи 
+# инициализации принадлежат циклу событий родителя
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=AsyncSingleton._init_tasks.clear)
+
+
+async def warm_up_async(*classes) -> list:
+    return await asyncio.gather(*(class_.instance_async() 
+                                  for class_ in classes))
+
+
+# Сравним время старта и первого запроса для пяти одиночек, каждая из 
+# которых создаётся 50 мс
+
+def make_resources():
+    class Resource(metaclass=ThreadSafeSingleton):
+
+        def __init__(self) -> None:
+            time.sleep(0.05)
+
+        def handle(self):
+            return 'ok'
+
+    return [type(f'Resource{i}', (Resource,), {}) for i in range(5)]
+
+
+def measure(strategy):
+    resources = make_resources()
+    start = time.perf_counter()
+    if strategy == 'eager':
+        handles = [resource() for resource in resources]
+    elif strategy == 'lazy':
+        handles = [LazySingletonProxy(resource) for resource in resources]
+    else:
+        handles = warm_up(*resources)
+    started = time.perf_counter()
+    for handle in handles:
+        handle.handle()
+    served = time.perf_counter()
+    print(f'{strategy}: startup {started - start:.3f}s, '
+          f'first requests {served - started:.3f}s')
+
+
+for strategy in ('eager', 'lazy', 'warmed'):
+    measure(strategy)
+
+
+class AsyncResource(metaclass=AsyncSingleton):
+
+    async def async_init(self):
+        await asyncio.sleep(0.05)
+        self.ready = True
+
+
+class OtherAsyncResource(AsyncResource):
+    ...
+
+
+async def main():
+    start = time.perf_counter()
+    first, second = await warm_up_async(AsyncResource, OtherAsyncResource)
+    # Повторные вызовы не инициализируют заново
+    await asyncio.gather(*(AsyncResource.instance_async() for _ in range(10)))
+    print(f'async warm up: {time.perf_counter() - start:.3f}s, '
+          f'ready: {first.ready and second.ready}')
+
+
+asyncio.run(main())
+
+
+# Первый вызов перестал ждать, а цикл событий завершился раньше, чем 
+# инициализация: asyncio.run отменяет её задачу. В новом цикле 
+# инициализация начинается заново.
+
+class InterruptedResource(AsyncResource):
+    ...
+
+
+async def impatient_main():
+    try:
+        await asyncio.wait_for(InterruptedResource.instance_async(), 0.01)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def patient_main():
+    resource = await InterruptedResource.instance_async()
+    print(f'after cancelled init: ready {resource.ready}')
+
+
+asyncio.run(impatient_main())
+asyncio.run(patient_main())
+
+
+# Иногда нужен не один экземпляр на класс, а один экземпляр на ключ: на строку 
+# подключения к базе, на арендатора и т.д. Это Пул одиночек (Multiton). Ключом 
+# служат аргументы конструктора, а чтобы память не росла бесконечно, кэш 
+# бывает трёх видов:
+# - 'strong' - экземпляры живут вечно, как у обычного одиночки;
+# - 'weak' - кэш не удерживает экземпляры, они исчезают вместе с последней 
+# ссылкой снаружи;
+# - 'lru' - хранится не больше maxsize экземпляров, лишние вытесняются по 
+# давности использования.
+# Создание экземпляра блокирует только свой ключ, поэтому медленный 
+# конструктор для одного ключа не задерживает остальные.
+
+import weakref
+from collections import OrderedDict
+
+
+class InstanceCache:
+
+    def __init__(self, cache: str = 'strong', maxsize: int = 128) -> None:
+        if cache == 'weak':
+            self._instances = weakref.WeakValueDictionary()
+        elif cache == 'lru':
+            self._instances = OrderedDict()
+        elif cache == 'strong':
+            self._instances = {}
+        else:
+            raise ValueError(f'Unknown cache type: {cache}')
+
+        self._lru = cache == 'lru'
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        instance = self._instances.get(key, _MISSING)
+        if instance is not _MISSING and self._lru:
+            self._instances.move_to_end(key)
+        return instance
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            instance = self._lookup(key)
+            if instance is not _MISSING:
+                self.hits += 1
+                return instance
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Пока ждали, экземпляр мог создать другой поток
+                instance = self._lookup(key)
+                if instance is not _MISSING:
+                    self.hits += 1
+                    return instance
+
+            instance = factory()
+            with self._lock:
+                self.misses += 1
+                self._instances[key] = instance
+                if self._lru and len(self._instances) > self._maxsize:
+                    self._instances.popitem(last=False)
+                    self.evictions += 1
+                # Ждущие уже держат ссылку на блокировку, новые потоки 
+                # найдут готовый экземпляр
+                del self._key_locks[key]
+
+        return instance
+
+    def info(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 
+                    'evictions': self.evictions, 
+                    'size': len(self._instances)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._instances.clear()
+
+
+class Multiton(type):
+    """Метакласс пула одиночек, вид кэша задаётся при объявлении класса:
+
+        class Connection(metaclass=Multiton, cache='lru', maxsize=16): ...
+
+    Наследник без этих параметров получает такие же настройки, как у 
+    ближайшего предка, но свой собственный кэш.
+    """
+
+    def __new__(mcs, name, bases, namespace, cache=None, maxsize=None):
+        return super().__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace, cache=None, maxsize=None):
+        super().__init__(name, bases, namespace)
+        # Пока свои настройки не записаны, getattr находит настройки предка
+        base_cache, base_maxsize = getattr(cls, '_multiton_config', 
+                                           ('strong', 128))
+        cls._multiton_config = (cache or base_cache, 
+                                maxsize if maxsize is not None 
+                                else base_maxsize)
+        # Сохраняем в словарь класса напрямую: у каждого наследника 
+        # должен быть свой кэш
+        cls._multiton_cache = InstanceCache(*cls._multiton_config)
+
+    def __call__(cls, *args: Any, **kwargs: Any) -> Any:
+        # Как и у functools.lru_cache, Class(1) и Class(key=1) - разные ключи
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        return cls._multiton_cache.get_or_create(
+            key, lambda: super(Multiton, cls).__call__(*args, **kwargs))
+
+    def cache_info(cls) -> dict:
+        return cls._multiton_cache.info()
+
+    def cache_clear(cls) -> None:
+        cls._multiton_cache.clear()
+
+
+class DBConnection(metaclass=Multiton, cache='lru', maxsize=2):
+
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+
+
+class TenantSettings(metaclass=Multiton, cache='weak'):
+
+    def __init__(self, tenant_id: int) -> None:
+        self.tenant_id = tenant_id
+
+
+assert DBConnection('db1') is DBConnection('db1')
+DBConnection('db2')
+DBConnection('db3')  # вытесняет db1
+assert DBConnection('db3') is DBConnection('db3')
+print(DBConnection.cache_info())
+
+
+# Наследник без параметров кэша остаётся таким же ограниченным
+class ReplicaConnection(DBConnection):
+    ...
+
+
+for replica in range(5):
+    ReplicaConnection(f'replica{replica}')
+assert ReplicaConnection.cache_info()['size'] == 2
+
+settings = TenantSettings(1)
+assert TenantSettings(1) is settings
+del settings
+print(TenantSettings.cache_info())
+
+# Разные ключи создаются параллельно: 8 ключей по 50 мс из 8 потоков
+class SlowMultiton(metaclass=Multiton):
+
+    def __init__(self, key) -> None:
+        time.sleep(0.05)
+
+
+start = time.perf_counter()
+warm_up(*(lambda key=key: SlowMultiton(key) for key in range(8)))
+print(f'8 keys in {time.perf_counter() - start:.3f}s, '
+      f'{SlowMultiton.cache_info()}')
@@ -26,49 +26,49 @@ class IState(ABC):
 class NoCoinState(IState):
 
     def insert_coin(self):
-        print('coin inserted')
+        self._context.output('coin inserted')
         self._context.set_state(self._context.get_has_coin_state())
 
     def eject_coin(self):
-        print('no coin to eject')
+        self._context.output('no coin to eject')
 
     def turn_crank(self):
-        print('insert coin first')
+        self._context.output('insert coin first')
 
     def dispense(self):
-        print('no coin = no gum')
+        self._context.output('no coin = no gum')
 
 
 class HasCoinState(IState):
 
     def insert_coin(self):
-        print('there is already coin')
+        self._context.output('there is already coin')
 
     def eject_coin(self):
-        print('coin ejected')
+        self._context.output('coin ejected')
         self._context.set_state(self._context.get_no_coin_state())
 
     def turn_crank(self):
-        print('crank has turned')
+        self._context.output('crank has turned')
         self._context.set_state(self._context.get_sold_state())
 
     def dispense(self):
-        print('turn crank first')
+        self._context.output('turn crank first')
 
 
 class SoldState(IState):
 
     def insert_coin(self):
-        print('take gum first')
+        self._context.output('take gum first')
 
     def eject_coin(self):
-        print('no eject, gum sold - take it')
+        self._context.output('no eject, gum sold - take it')
 
     def turn_crank(self):
-        print('no double gum - take gum in dispenser')
+        self._context.output('no double gum - take gum in dispenser')
 
     def dispense(self):
-        print('sold')
+        self._context.output('sold')
         self._context.release_ball()
         if self._context.get_gumballs_count() > 0:
             self._context.set_state(self._context.get_no_coin_state())
@@ -79,23 +79,26 @@ class SoldState(IState):
 class NoGumState(IState):
 
     def insert_coin(self):
-        print('no gum')
+        self._context.output('no gum')
 
     def eject_coin(self):
-        print('no gum')
+        self._context.output('no gum')
 
     def turn_crank(self):
-        print('no gum')
+        self._context.output('no gum')
 
     def dispense(self):
-        print('no gum')
+        self._context.output('no gum')
 
 
 class GumballMachine:
     """Context/Контекст на диаграмме классов"""
 
-    def __init__(self, gumballs_count) -> None:
+    def __init__(self, gumballs_count, output=print) -> None:
         self._gumballs_count = gumballs_count
+        # Состояния пишут сообщения через output: по умолчанию это print, 
+        # но можно передать любую функцию, принимающую строку
+        self.output = output
 
         self._no_coin_state = NoCoinState(self)
         self._has_coin_state = HasCoinState(self)
@@ -148,3 +151,558 @@ gumball_machine.turn_crank()
 gumball_machine.eject_coin()
 gumball_machine.dispense()
 gumball_machine.insert_coin()
+
+
+# Состояния пишут сообщения через output автомата, поэтому приёмник 
+# сообщений можно подменить. Это пригодится ниже: в пакетных прогонах 
+# большую часть времени съедает print, ведь каждое событие - это синхронная 
+# запись в терминал или канал. Готовые приёмники:
+# - SilentSink - сообщения не нужны вовсе;
+# - BufferedSink - сообщения копятся в памяти, например для проверок;
+# - BatchedFileSink - сообщения пишутся в файл блоками по batch_size строк.
+# Приёмник - это просто вызываемый объект, принимающий строку, поэтому 
+# вместо него годится и обычный print или list.append.
+
+class SilentSink:
+
+    def __call__(self, message: str) -> None:
+        pass
+
+
+class BufferedSink:
+
+    def __init__(self) -> None:
+        self.messages = []
+
+    def __call__(self, message: str) -> None:
+        self.messages.append(message)
+
+    def getvalue(self) -> str:
+        return ''.join(f'{message}\n' for message in self.messages)
+
+
+class BatchedFileSink:
+
+    def __init__(self, file, batch_size: int = 8192) -> None:
+        self._file = file
+        self._batch_size = batch_size
+        self._batch = []
+
+    def __call__(self, message: str) -> None:
+        self._batch.append(message)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._batch:
+            self._batch.append('')
+            self._file.write('\n'.join(self._batch))
+            self._batch.clear()
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+# Объектный автомат удобен для чтения, но медленный для массовой обработки: 
+# каждое событие - это вызов метода состояния, печать и вызов геттеров 
+# контекста. Для проверки длинных потоков событий классы состояний можно 
+# "скомпилировать" в таблицу: каждый обработчик один раз выполняется на 
+# контексте-зонде, который записывает, какое сообщение выведено, в какое 
+# состояние совершён переход и выдана ли жвачка. Переход из SoldState 
+# зависит от остатка жвачки, поэтому каждый обработчик прогоняется дважды: 
+# когда жвачка после выдачи ещё останется и когда закончится.
+# Дальше события обрабатываются циклом по целочисленной таблице, а 
+# результат совпадает с объектным автоматом, потому что таблица получена из 
+# тех же классов.
+
+import contextlib
+import os
+import random
+import time
+from array import array
+
+EVENTS = ('insert_coin', 'eject_coin', 'turn_crank', 'dispense')
+STATE_GETTERS = ('get_no_coin_state', 'get_has_coin_state', 
+                 'get_sold_state', 'get_no_gum_state')
+
+
+class ProbeContext:
+    """Контекст, который только записывает действия состояния"""
+
+    def __init__(self, gumballs_count) -> None:
+        self._gumballs_count = gumballs_count
+        self.output = BufferedSink()
+        self.next_state = None
+        self.released = 0
+        for state_id, getter in enumerate(STATE_GETTERS):
+            setattr(self, getter, lambda state_id=state_id: state_id)
+
+    def set_state(self, new_state):
+        self.next_state = new_state
+
+    def release_ball(self):
+        self._gumballs_count -= 1
+        self.released += 1
+
+    def get_gumballs_count(self):
+        return self._gumballs_count
+
+
+class CompiledGumballMachine:
+    """Табличный автомат, собранный из классов состояний.
+
+    Строка таблицы для (состояние, событие, останется ли жвачка) хранит 
+    следующее состояние, сколько жвачки выдано и номер сообщения.
+    """
+
+    def __init__(self, state_classes=(NoCoinState, HasCoinState, 
+                                      SoldState, NoGumState)) -> None:
+        self.messages = []
+        message_ids = {}
+        self._next_states = array('B')
+        self._released = array('B')
+        self._message_ids = array('H')
+        for state_id, state_class in enumerate(state_classes):
+            for event in EVENTS:
+                # 1 - после выдачи жвачки не останется, 2 - останется
+                for gumballs_count in (1, 2):
+                    context = ProbeContext(gumballs_count)
+                    getattr(state_class(context), event)()
+                    message = '\n'.join(context.output.messages)
+                    if message not in message_ids:
+                        message_ids[message] = len(self.messages)
+                        self.messages.append(message)
+                    next_state = context.next_state
+                    self._next_states.append(
+                        state_id if next_state is None else next_state)
+                    self._released.append(context.released)
+                    self._message_ids.append(message_ids[message])
+
+    def run(self, events, gumballs_count: int, output: array = None, 
+            state: int = None) -> tuple:
+        """Обрабатывает номера событий (индексы в EVENTS) и возвращает 
+        (номер состояния, остаток жвачки). Если передан output, в него 
+        дописываются номера напечатанных сообщений. Без state автомат 
+        стартует так же, как новый GumballMachine."""
+        next_states = self._next_states
+        released = self._released
+        message_ids = self._message_ids
+        if state is None:
+            state = 0 if gumballs_count > 0 else 3
+        for event in events:
+            row = (state * 4 + event) * 2 + (gumballs_count > 1)
+            state = next_states[row]
+            gumballs_count -= released[row]
+            if output is not None:
+                output.append(message_ids[row])
+
+        return state, gumballs_count
+
+
+def run_object_machine(events, gumballs_count, output=print):
+    machine = GumballMachine(gumballs_count, output)
+    handlers = [getattr(machine, event) for event in EVENTS]
+    for event in events:
+        handlers[event]()
+    state_id = [getattr(machine, getter)() 
+                for getter in STATE_GETTERS].index(machine._current_state)
+    return state_id, machine.get_gumballs_count()
+
+
+compiled_machine = CompiledGumballMachine()
+
+# Проверяем совпадение вместе с текстом сообщений
+events = array('B', [random.randrange(4) for _ in range(20_000)])
+object_sink = BufferedSink()
+expected = run_object_machine(events, 3000, object_sink)
+compiled_output = array('H')
+assert compiled_machine.run(events, 3000, compiled_output) == expected
+assert object_sink.messages == [compiled_machine.messages[message_id] 
+                                for message_id in compiled_output]
+
+events = array('B', [random.randrange(4) for _ in range(1_000_000)])
+start = time.perf_counter()
+expected = run_object_machine(events, 100_000, SilentSink())
+object_elapsed = time.perf_counter() - start
+
+start = time.perf_counter()
+assert compiled_machine.run(events, 100_000) == expected
+compiled_elapsed = time.perf_counter() - start
+print(f'objects: {len(events) / object_elapsed:,.0f} events/s, '
+      f'compiled: {len(events) / compiled_elapsed:,.0f} events/s')
+
+
+# Для моделирования парка из десятков тысяч автоматов не нужны объекты 
+# вовсе: состояние каждого автомата - это номер состояния и остаток жвачки, 
+# их удобно хранить двумя колонками array. Пачка событий - это пара колонок 
+# (номер автомата, номер события), а переходы берутся из той же 
+# скомпилированной таблицы, поэтому семантика NoCoinState, HasCoinState, 
+# SoldState и NoGumState сохраняется. События одного автомата применяются в 
+# порядке следования в пачке.
+
+class GumballFleet:
+
+    def __init__(self, machines_count: int, gumballs_count: int, 
+                 compiled: CompiledGumballMachine = None) -> None:
+        self._compiled = compiled or CompiledGumballMachine()
+        initial_state = 0 if gumballs_count > 0 else 3
+        self.states = array('B', [initial_state]) * machines_count
+        self.gumballs = array('q', [gumballs_count]) * machines_count
+
+    def apply(self, machines, events) -> None:
+        states = self.states
+        gumballs = self.gumballs
+        next_states = self._compiled._next_states
+        released = self._compiled._released
+        for machine, event in zip(machines, events):
+            count = gumballs[machine]
+            row = (states[machine] * 4 + event) * 2 + (count > 1)
+            states[machine] = next_states[row]
+            gumballs[machine] = count - released[row]
+
+
+# Проверим на маленьком парке против объектов
+
+fleet = GumballFleet(50, 5, compiled_machine)
+object_fleet = [GumballMachine(5, SilentSink()) for _ in range(50)]
+machines = array('L', [random.randrange(50) for _ in range(20_000)])
+events = array('B', [random.randrange(4) for _ in range(20_000)])
+fleet.apply(machines, events)
+for machine, event in zip(machines, events):
+    getattr(object_fleet[machine], EVENTS[event])()
+assert list(fleet.gumballs) == [machine.get_gumballs_count() 
+                                for machine in object_fleet]
+assert list(fleet.states) == [
+    [getattr(machine, getter)() for getter in STATE_GETTERS].index(
+        machine._current_state)
+    for machine in object_fleet
+]
+
+events = events * 15
+
+for machines_count in (1_000, 10_000, 100_000):
+    fleet = GumballFleet(machines_count, 100, compiled_machine)
+    machines = array('L', [random.randrange(machines_count) 
+                           for _ in range(len(events))])
+    start = time.perf_counter()
+    fleet.apply(machines, events)
+    elapsed = time.perf_counter() - start
+    print(f'{machines_count} machines: {len(events) / elapsed:,.0f} events/s')
+
+
+# Автомат, работающий годами, накапливает огромную историю, и 
+# восстанавливать его повторением всех событий долго. Поможет хранение 
+# событий (event sourcing) со снимками: каждое событие дописывается в журнал 
+# одним байтом, а каждые snapshot_every событий в отдельный файл пишется 
+# двоичный снимок (состояние, остаток жвачки, смещение в журнале). Для 
+# восстановления достаточно последнего снимка и хвоста журнала после него.
+
+import struct
+
+
+class GumballEventStore:
+
+    _snapshot = struct.Struct('<BqQ')
+
+    def __init__(self, directory: str) -> None:
+        self._events_path = os.path.join(directory, 'events.log')
+        self._snapshots_path = os.path.join(directory, 'snapshots.bin')
+        self._events = open(self._events_path, 'ab')
+        self._snapshots = open(self._snapshots_path, 'ab')
+        self.offset = self._events.tell()
+
+    def append(self, event_id: int) -> None:
+        self._events.write(bytes((event_id,)))
+        self.offset += 1
+
+    def snapshot(self, state_id: int, gumballs_count: int) -> None:
+        # Снимок не должен ссылаться на события, которых ещё нет на диске
+        self._events.flush()
+        self._snapshots.write(
+            self._snapshot.pack(state_id, gumballs_count, self.offset))
+        self._snapshots.flush()
+
+    def latest_snapshot(self):
+        """Последний целый снимок (состояние, остаток, смещение) или None"""
+        size = os.path.getsize(self._snapshots_path)
+        size -= size % self._snapshot.size
+        if not size:
+            return None
+
+        with open(self._snapshots_path, 'rb') as file:
+            file.seek(size - self._snapshot.size)
+            return self._snapshot.unpack(file.read(self._snapshot.size))
+
+    def read_events(self, offset: int = 0) -> bytes:
+        self._events.flush()
+        with open(self._events_path, 'rb') as file:
+            file.seek(offset)
+            return file.read()
+
+    def close(self) -> None:
+        self._events.close()
+        self._snapshots.close()
+
+
+class EventSourcedGumballMachine(GumballMachine):
+    """Автомат, дописывающий события в хранилище.
+
+    Новый автомат сразу пишет снимок на текущем конце журнала: история, 
+    которая уже была в хранилище, к нему не относится, и восстановление 
+    начнётся с этого снимка. state задаёт начальное состояние так же, как в 
+    CompiledGumballMachine.run.
+    """
+
+    def __init__(self, gumballs_count, store: GumballEventStore, 
+                 snapshot_every: int = 10_000, output=print, 
+                 state: int = None) -> None:
+        super().__init__(gumballs_count, output)
+        if state is not None:
+            self.set_state(getattr(self, STATE_GETTERS[state])())
+        self._store = store
+        self._snapshot_every = snapshot_every
+        store.snapshot(self.get_state_id(), self._gumballs_count)
+        self._last_snapshot = store.offset
+
+    @classmethod
+    def restore(cls, store: GumballEventStore, 
+                compiled: CompiledGumballMachine, 
+                snapshot_every: int = 10_000, output=print):
+        snapshot = store.latest_snapshot()
+        if snapshot is None:
+            raise ValueError('Event store has no snapshot to restore from')
+
+        state_id, gumballs_count, offset = snapshot
+        state_id, gumballs_count = compiled.run(
+            store.read_events(offset), gumballs_count, state=state_id)
+        return cls(gumballs_count, store, snapshot_every, output, state_id)
+
+    def get_state_id(self):
+        return [getattr(self, getter)() 
+                for getter in STATE_GETTERS].index(self._current_state)
+
+    def _handle(self, event_id):
+        self._store.append(event_id)
+        getattr(self._current_state, EVENTS[event_id])()
+        if self._store.offset - self._last_snapshot >= self._snapshot_every:
+            self._store.snapshot(self.get_state_id(), self._gumballs_count)
+            self._last_snapshot = self._store.offset
+
+    def insert_coin(self):
+        self._handle(0)
+
+    def eject_coin(self):
+        self._handle(1)
+
+    def turn_crank(self):
+        self._handle(2)
+
+    def dispense(self):
+        self._handle(3)
+
+
+# Сравним восстановление по всей истории и по снимку с хвостом
+
+import tempfile
+
+for history_length in (10_000, 100_000, 300_000):
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = GumballEventStore(store_dir)
+        machine = EventSourcedGumballMachine(history_length, store, 
+                                             output=SilentSink())
+        handlers = [getattr(machine, event) for event in EVENTS]
+        for event in array('B', [random.randrange(4) 
+                                 for _ in range(history_length)]):
+            handlers[event]()
+        expected = (machine.get_state_id(), machine.get_gumballs_count())
+
+        start = time.perf_counter()
+        replayed = GumballMachine(history_length, SilentSink())
+        replayed_handlers = [getattr(replayed, event) for event in EVENTS]
+        for event in store.read_events():
+            replayed_handlers[event]()
+        full_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        restored = EventSourcedGumballMachine.restore(
+            store, compiled_machine, output=SilentSink())
+        snapshot_elapsed = time.perf_counter() - start
+        assert (restored.get_state_id(), 
+                restored.get_gumballs_count()) == expected
+        store.close()
+
+    print(f'history {history_length}: full replay {full_elapsed:.3f}s, '
+          f'snapshot + tail {snapshot_elapsed * 1000:.2f} ms')
+
+
+# Объектный автомат не рассчитан на несколько потоков: переходы состоят из 
+# нескольких шагов (проверить остаток, выдать жвачку, сменить состояние), и 
+# два клиента, одновременно дёргающие insert_coin и turn_crank, могут оба 
+# пройти через SoldState.dispense - жвачки продаётся больше, чем было.
+# Достаточно сериализовать переходы одного автомата: каждое событие 
+# выполняется под блокировкой автомата, а покупка целиком (монета, ручка, 
+# выдача) - одним атомарным действием. Разные автоматы друг другу не мешают.
+
+import sys
+import threading
+
+
+class ConcurrentGumballMachine(GumballMachine):
+
+    def __init__(self, gumballs_count, output=print) -> None:
+        super().__init__(gumballs_count, output)
+        self._lock = threading.Lock()
+
+    def insert_coin(self):
+        with self._lock:
+            self._current_state.insert_coin()
+
+    def eject_coin(self):
+        with self._lock:
+            self._current_state.eject_coin()
+
+    def turn_crank(self):
+        with self._lock:
+            self._current_state.turn_crank()
+
+    def dispense(self):
+        with self._lock:
+            self._current_state.dispense()
+
+    def buy(self) -> bool:
+        """Монета, ручка и выдача как одно действие. Возвращает True, если 
+        жвачка выдана."""
+        with self._lock:
+            before = self._gumballs_count
+            self._current_state.insert_coin()
+            self._current_state.turn_crank()
+            self._current_state.dispense()
+            return self._gumballs_count < before
+
+
+# Когда клиентов очень много, даже блокировка одного автомата становится 
+# узким местом. Запас можно разложить по нескольким автоматам-шардам: 
+# каждый поток начинает со "своего" шарда и переходит к следующим, только 
+# если в нём жвачка закончилась. Стартовые шарды раздаются потокам по кругу 
+# при первой покупке: threading.get_ident() для этого не годится - это 
+# выровненный адрес, и остаток от деления на число шардов у всех потоков 
+# один и тот же.
+
+import itertools
+
+
+class ShardedGumballPool:
+
+    def __init__(self, shards_count: int, gumballs_count: int, 
+                 output=print) -> None:
+        per_shard, extra = divmod(gumballs_count, shards_count)
+        self._shards = [
+            ConcurrentGumballMachine(per_shard + (idx < extra), output) 
+            for idx in range(shards_count)
+        ]
+        self._next_first = itertools.count()
+        self._local = threading.local()
+
+    def buy(self) -> bool:
+        first = getattr(self._local, 'first', None)
+        if first is None:
+            first = self._local.first = \
+                next(self._next_first) % len(self._shards)
+        for offset in range(len(self._shards)):
+            shard = self._shards[(first + offset) % len(self._shards)]
+            # Чтение без блокировки только отсеивает пустые шарды, 
+            # окончательно остаток проверяется внутри buy
+            if shard.get_gumballs_count() > 0 and shard.buy():
+                return True
+        return False
+
+    def get_gumballs_count(self):
+        return sum(shard.get_gumballs_count() for shard in self._shards)
+
+
+# Стресс-тест: потоки покупают, пока жвачка не кончится. Частое 
+# переключение потоков расширяет окно гонки у обычного автомата.
+
+def unsafe_buy(machine):
+    before = machine.get_gumballs_count()
+    machine.insert_coin()
+    machine.turn_crank()
+    machine.dispense()
+    return machine.get_gumballs_count() < before
+
+
+def stress(buy, threads_count, attempts=2000):
+    sold = [0] * threads_count
+
+    def client(idx):
+        for _ in range(attempts):
+            if buy():
+                sold[idx] += 1
+
+    clients = [threading.Thread(target=client, args=(idx,)) 
+               for idx in range(threads_count)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return sum(sold), time.perf_counter() - start
+
+
+stock = 5000
+switch_interval = sys.getswitchinterval()
+sys.setswitchinterval(1e-6)
+results = []
+for threads_count in (1, 4, 16):
+    machine = GumballMachine(stock, SilentSink())
+    unsafe = stress(lambda: unsafe_buy(machine), threads_count)
+    results.append(('unsafe', threads_count, *unsafe, 
+                    machine.get_gumballs_count()))
+
+    machine = ConcurrentGumballMachine(stock, SilentSink())
+    locked = stress(machine.buy, threads_count)
+    results.append(('locked', threads_count, *locked, 
+                    machine.get_gumballs_count()))
+
+    pool = ShardedGumballPool(8, stock, SilentSink())
+    sharded = stress(pool.buy, threads_count)
+    results.append(('sharded', threads_count, *sharded, 
+                    pool.get_gumballs_count()))
+sys.setswitchinterval(switch_interval)
+
+for title, threads_count, sold, elapsed, left in results:
+    print(f'{title}, {threads_count} threads: sold {sold} of {stock}, '
+          f'left {left}, {threads_count * 2000 / elapsed:,.0f} attempts/s')
+
+
+# Прогоним миллион событий с разными приёмниками. print здесь пишет в 
+# /dev/null - это нижняя граница, в терминал или канал выходит ещё дольше.
+
+def run_with_output(events, output):
+    machine = GumballMachine(len(events), output)
+    handlers = [getattr(machine, event) for event in EVENTS]
+    start = time.perf_counter()
+    for event in events:
+        handlers[event]()
+    return time.perf_counter() - start
+
+
+events = array('B', [random.randrange(4) for _ in range(1_000_000)])
+with open(os.devnull, 'w') as devnull:
+    with contextlib.redirect_stdout(devnull):
+        print_elapsed = run_with_output(events, print)
+    with BatchedFileSink(devnull) as batched_sink:
+        batched_elapsed = run_with_output(events, batched_sink)
+buffered_sink = BufferedSink()
+buffered_elapsed = run_with_output(events, buffered_sink)
+silent_elapsed = run_with_output(events, SilentSink())
+
+for title, elapsed in (('print', print_elapsed), 
+                       ('batched file', batched_elapsed), 
+                       ('buffered', buffered_elapsed), 
+                       ('silent', silent_elapsed)):
+    print(f'{title}: {elapsed:.2f}s')
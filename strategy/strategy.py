@@ -61,6 +61,11 @@ from abc import ABC, abstractmethod
 
 class IBarkBehaviour(ABC):
 
+    def __init__(self, output=print):
+        # Куда "лаять": по умолчанию print, но можно передать любую функцию, 
+        # принимающую строку, например list.append
+        self._output = output
+
     @abstractmethod
     def bark(self):
         """Make some noise"""
@@ -69,25 +74,25 @@ class IBarkBehaviour(ABC):
 class SimpleBark(IBarkBehaviour):
 
     def bark(self):
-        print('Bark!')
+        self._output('Bark!')
 
 
 class MightyWoof(IBarkBehaviour):
 
     def bark(self):
-        print('WOOF!')
+        self._output('WOOF!')
 
 
 class NoBark(IBarkBehaviour):
     
     def bark(self):
-        print('< silence >')
+        self._output('< silence >')
 
 
 class Squeak(IBarkBehaviour):
 
     def bark(self):
-        print('squek')
+        self._output('squek')
 
 
 # Выше описан интерфейс "лая" и разные его реализации. Осталось только 
@@ -130,3 +135,14 @@ basenji_one.bark()
 
 # В дальнейшем стратегия также может помочь, когда собакам пропишут новые 
 # изменяемые действия
+
+
+# Стратегии пишут через переданную функцию, поэтому в пакетных прогонах 
+# вывод можно собрать в память или отключить, не трогая классы собак
+
+barks = []
+basenji_two = Basenji()
+basenji_two.set_bark_behaviour(Squeak(barks.append))
+for _ in range(3):
+    basenji_two.bark_behaviour.bark()
+print(barks)
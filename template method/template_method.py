@@ -76,6 +76,11 @@ class Tea:
 
 class Beverage(ABC):
 
+    def __init__(self, output=print):
+        # Шаги пишут через output: по умолчанию print, но можно передать 
+        # любую функцию, принимающую строку
+        self._output = output
+
     def prepare_beverage(self):
         self.boil_water()
         self.brew()
@@ -83,10 +88,10 @@ class Beverage(ABC):
         self.add_condiments()
 
     def boil_water(self):
-        print('Boiling water!')
+        self._output('Boiling water!')
 
     def pour_in_cup(self):
-        print('Pouring in cup')
+        self._output('Pouring in cup')
 
     @abstractmethod
     def brew(self):
@@ -100,20 +105,29 @@ class Beverage(ABC):
 class Coffee(Beverage):
 
     def brew(self):
-        print('Putting few spoons of coffee')
+        self._output('Putting few spoons of coffee')
 
     def add_condiments(self):
-        print('Adding sugar and milk')
+        self._output('Adding sugar and milk')
 
 
 class Tea(Beverage):
 
     def brew(self):
-        print('Steeping teabag')
+        self._output('Steeping teabag')
 
     def add_condiments(self):
-        print('Adding lemon')
+        self._output('Adding lemon')
 
 # Теперь чаю и кофе достаточно переопределить пару методов. Также можно добавить
 # несколько перехватчиков, например спрашивать пользователя о добавках прежде, 
 # чем добавлять их
+
+
+# Так как шаги пишут через output, в пакетном режиме вывод можно собрать в 
+# память или отключить, не меняя сам алгоритм
+
+steps = []
+for beverage in (Coffee(steps.append), Tea(steps.append)):
+    beverage.prepare_beverage()
+print(steps)